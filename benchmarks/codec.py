@@ -0,0 +1,115 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Measures message codec throughput per model and json backend.
+#
+# The "legacy" rows reimplement the per-key conversions used before the schema
+# codecs and serve as baseline.
+#
+# Run from the connector's working directory (needs storage/dyson.conf):
+#   python benchmarks/codec.py --number 100000
+
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dyson import codec
+from dyson.types.schema import schemas
+import argparse, importlib, json, timeit
+
+
+state = {
+    "fmod": "FAN", "fnst": "FAN", "fnsp": "0004", "qtar": "0003", "oson": "OFF", "rhtm": "ON", "filf": "2159",
+    "ercd": "NONE", "nmod": "OFF", "wacd": "NONE", "hmod": "HEAT", "hmax": "2980", "hsta": "OFF", "ffoc": "ON", "tilt": "OK"
+}
+
+readings = {"tact": "2950", "hact": "0045", "pact": "0003", "vact": "0002"}
+
+message = json.dumps({"msg": "CURRENT-STATE", "time": "2020-01-01T00:00:00.000Z", "mode-reason": "LAPP", "product-state": state}).encode()
+
+value_map = {"FAN": True, "AUTO": True, "ON": True, "OFF": False}
+
+
+def legacyState(state):
+    return {
+        "power": value_map[state["fmod"]],
+        "oscillation": value_map[state["oson"]],
+        "speed": 0 if state["fnsp"] == "AUTO" else int(state["fnsp"]),
+        "monitoring": value_map[state["rhtm"]],
+        "filter_life": round(int(state["filf"]) / 4300 * 100, 2)
+    }
+
+
+def legacyReadings(readings):
+    readings = readings.copy()
+    for key, value in readings.items():
+        if key == "tact":
+            readings[key] = int(value) / 10
+        else:
+            readings[key] = int(value)
+    return readings
+
+
+def legacyFullState(state, changes):
+    data = dict(state)
+    data.update(changes)
+    for key in ('filf', 'fnst', 'ercd', 'wacd'):
+        data.pop(key, None)
+    data.update({'sltm': 'STET', 'rstf': 'STET'})
+    return data
+
+
+def backends() -> dict:
+    available = dict()
+    for name in ("json", "ujson", "orjson"):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        available[name] = codec.loadBackend(name)
+    return available
+
+
+def measure(target, number) -> float:
+    return number / min(timeit.repeat(target, number=number, repeat=3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark message codecs")
+    parser.add_argument("--number", type=int, default=100000, help="calls per measurement")
+    args = parser.parse_args()
+    rows = [
+        ("legacy", "-", "decode_state", lambda: legacyState(state)),
+        ("legacy", "-", "decode_readings", lambda: legacyReadings(readings)),
+        ("legacy", "-", "full_state", lambda: legacyFullState(state, {"fmod": "OFF"})),
+    ]
+    for model_num, schema in sorted(schemas.items()):
+        rows.append(("schema", model_num, "decode_state", lambda schema=schema: schema.decodeState(state)))
+        rows.append(("schema", model_num, "decode_readings", lambda schema=schema: schema.decodeReadings(readings)))
+        rows.append(("schema", model_num, "encode", lambda schema=schema: schema.encode(power=False, speed=4)))
+        rows.append(("schema", model_num, "full_state", lambda schema=schema: schema.fullState(state, {"fmod": "OFF"})))
+    for name, (_, loads, dumps) in backends().items():
+        rows.append((name, "-", "loads", lambda loads=loads: loads(message)))
+        rows.append((name, "-", "dumps", lambda dumps=dumps: dumps({"msg": "STATE-SET", "data": state})))
+    columns = ("codec", "model", "operation", "ops_per_sec")
+    print(" ".join("{:>16}".format(column) for column in columns))
+    for codec_name, model_num, operation, target in rows:
+        print(" ".join("{:>16}".format(value) for value in (codec_name, model_num, operation, "{:.0f}".format(measure(target, args.number)))))
+
+
+if __name__ == '__main__':
+    main()
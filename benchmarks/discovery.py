@@ -0,0 +1,319 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Compares local discovery backends against a simulated network.
+#
+# Ping, port probe, neighbour table and reverse lookup calls are replaced with
+# stand-ins that answer according to the simulated hosts, so no real traffic is
+# generated. Latencies and timeouts are multiplied by --time-scale to keep runs short.
+#
+# With --identify mqtt the real Fingerprinter runs against simulated brokers, only
+# its connections are replaced. The mdns method registers the simulated devices on
+# a loopback zeroconf instance and measures the real MDNSBrowser, its results do
+# not depend on the prefix.
+#
+# Run from the connector's working directory (needs storage/dyson.conf):
+#   python benchmarks/discovery.py --prefixes 24,22,20 --methods ping,arp,sweep,mdns --identify dns,mqtt
+
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dyson.configuration import config
+from dyson.discovery import local_monitor, sweep, resolver, fingerprint, mdns
+from concurrent.futures import ThreadPoolExecutor
+from zeroconf import Zeroconf, ServiceInfo, IPVersion
+import argparse, asyncio, ipaddress, queue, random, socket, struct, threading, time
+
+
+class Counter:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.value = 0
+        self.active = 0
+        self.peak = 0
+
+    def enter(self):
+        with self.__lock:
+            self.value += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def exit(self):
+        with self.__lock:
+            self.active -= 1
+
+
+class SimulatedNetwork:
+    def __init__(self, network, live_hosts, devices, latency, timeout, dns_latency, dns_failure_rate, dns_hang_rate):
+        self.network = network
+        self.live_hosts = live_hosts
+        self.devices = devices
+        self.latency = latency
+        self.timeout = timeout
+        self.dns_latency = dns_latency
+        self.dns_failure_rate = dns_failure_rate
+        self.dns_hang_rate = dns_hang_rate
+        self.sockets = Counter()
+        self.subprocesses = Counter()
+        self.lookups = Counter()
+        self.mqtt_connects = Counter()
+        self.passwords = {serial: "pw-{}".format(serial) for serial in devices.values()}
+
+    def addresses(self):
+        return (str(address) for address in self.network.hosts())
+
+    def ping(self, host) -> bool:
+        self.subprocesses.enter()
+        try:
+            time.sleep(self.latency if host in self.live_hosts else self.timeout)
+            return host in self.live_hosts
+        finally:
+            self.subprocesses.exit()
+
+    def probeHost(self, host, port) -> bool:
+        self.sockets.enter()
+        try:
+            time.sleep(self.latency if host in self.live_hosts else self.timeout)
+            return host in self.devices
+        finally:
+            self.sockets.exit()
+
+    async def probeHostAsync(self, host, port, timeout) -> bool:
+        self.sockets.enter()
+        try:
+            await asyncio.sleep(self.latency if host in self.live_hosts else min(timeout, self.timeout))
+            return host in self.devices
+        finally:
+            self.sockets.exit()
+
+    async def openConnection(self, host, port):
+        self.sockets.enter()
+        if host not in self.live_hosts:
+            await asyncio.sleep(self.timeout)
+            self.sockets.exit()
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(self.latency)
+        if host not in self.devices:
+            self.sockets.exit()
+            raise ConnectionRefusedError()
+        connection = SimulatedBroker(self, host)
+        return connection, connection
+
+    def neighbours(self) -> list:
+        return list(self.live_hosts)
+
+    def lookupHostname(self, host):
+        self.lookups.enter()
+        try:
+            roll = random.random()
+            if roll < self.dns_hang_rate:
+                time.sleep(self.timeout * 10)
+                return None
+            time.sleep(self.dns_latency)
+            if roll < self.dns_hang_rate + self.dns_failure_rate:
+                return None
+            return self.devices.get(host, "host-{}".format(host.replace(".", "-"))) + ".local"
+        finally:
+            self.lookups.exit()
+
+
+def readString(data, pos):
+    length = struct.unpack_from("!H", data, pos)[0]
+    return data[pos + 2:pos + 2 + length].decode(), pos + 2 + length
+
+
+class SimulatedBroker:
+    def __init__(self, sim: SimulatedNetwork, host):
+        self.sim = sim
+        self.host = host
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sim.sockets.exit()
+
+    async def readexactly(self, num):
+        # fixed header, variable header of 10 bytes, then client id, username and password
+        await asyncio.sleep(self.sim.latency)
+        self.sim.mqtt_connects.enter()
+        self.sim.mqtt_connects.exit()
+        pos = 1
+        while self.data[pos] & 0x80:
+            pos += 1
+        _, pos = readString(self.data, pos + 11)
+        username, pos = readString(self.data, pos)
+        password, pos = readString(self.data, pos)
+        serial = self.sim.devices[self.host]
+        return bytes((0x20, 2, 0, 0 if (username, password) == (serial, self.sim.passwords[serial]) else 4))
+
+
+def simulate(prefix, args) -> SimulatedNetwork:
+    network = ipaddress.IPv4Network("10.0.0.0/{}".format(prefix))
+    addresses = [str(address) for address in network.hosts()]
+    live_hosts = set(random.sample(addresses, min(len(addresses), int(len(addresses) * args.live_ratio))))
+    devices = {host: "NN2-EU-SIM{:04d}A".format(num) for num, host in enumerate(random.sample(sorted(live_hosts), min(len(live_hosts), args.devices)))}
+    return SimulatedNetwork(
+        network=network,
+        live_hosts=live_hosts,
+        devices=devices,
+        latency=args.latency * args.time_scale,
+        timeout=config.Discovery.probe_timeout * args.time_scale,
+        dns_latency=args.dns_latency * args.time_scale,
+        dns_failure_rate=args.dns_failure_rate,
+        dns_hang_rate=args.dns_hang_rate
+    )
+
+
+def install(sim: SimulatedNetwork, args):
+    local_monitor.iterLocalAddresses = sim.addresses
+    local_monitor.ping = sim.ping
+    local_monitor.probeHost = sim.probeHost
+    local_monitor.discoverNeighbours = sim.neighbours
+    sweep.probeHostAsync = sim.probeHostAsync
+    resolver.lookupHostname = sim.lookupHostname
+    cache = resolver.ResolverCache(
+        ttl=int(config.Discovery.dns_ttl),
+        negative_ttl=int(config.Discovery.dns_negative_ttl),
+        max_size=int(config.Discovery.dns_cache_size),
+        timeout=float(config.Discovery.dns_timeout) * args.time_scale,
+        workers=int(config.Discovery.dns_workers)
+    )
+    local_monitor.resolver = cache
+    sweep.resolver = cache
+    fingerprint.resolver = cache
+    fingerprint.Fingerprinter._Fingerprinter__open = lambda self, host, port: sim.openConnection(host, port)
+
+
+def discoverMdns(sim: SimulatedNetwork):
+    zeroconf = Zeroconf(interfaces=["127.0.0.1"], ip_version=IPVersion.V4Only)
+    infos = [
+        ServiceInfo(
+            mdns.service_type,
+            "475_{}.{}".format(serial, mdns.service_type),
+            port=1883,
+            addresses=[socket.inet_aton(host)],
+            server="{}.local.".format(serial.lower())
+        ) for host, serial in sim.devices.items()
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, len(infos))) as executor:
+        list(executor.map(lambda info: zeroconf.register_service(info, cooperating_responders=True, strict=False), infos))
+    found = set()
+    events = queue.Queue()
+
+    def callback(device_id, address):
+        if address:
+            events.put((device_id, address))
+
+    browser = mdns.MDNSBrowser(callback)
+    browser.start()
+    try:
+        while len(found) < len(infos):
+            try:
+                device_id, address = events.get(timeout=sim.timeout * 100)
+            except queue.Empty:
+                break
+            if device_id not in found:
+                found.add(device_id)
+                yield device_id, address
+    finally:
+        browser.stop()
+        zeroconf.close()
+
+
+def run(method, sim: SimulatedNetwork, identify: str) -> dict:
+    peak_threads = threading.active_count()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    found = dict()
+    first = None
+    start = time.perf_counter()
+    if method == "mdns":
+        devices = discoverMdns(sim)
+    elif identify == "mqtt":
+        devices = local_monitor.streamDevices(method, fingerprint.Fingerprinter({serial: sim.passwords[serial] for serial in sim.devices.values()}))
+    else:
+        devices = local_monitor.streamDevices(method)
+    for device_id, address in devices:
+        if first is None:
+            first = time.perf_counter() - start
+        found[device_id] = address
+    wall_time = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return {
+        "wall_time": wall_time,
+        "first_device": first,
+        "found": len(found),
+        "sockets": sim.sockets.value,
+        "peak_sockets": sim.sockets.peak,
+        "subprocesses": sim.subprocesses.value,
+        "lookups": sim.lookups.value,
+        "mqtt_connects": sim.mqtt_connects.value,
+        "peak_threads": peak_threads
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark local discovery backends on a simulated network")
+    parser.add_argument("--prefixes", default="24,23,22,21,20")
+    parser.add_argument("--methods", default="ping,arp,sweep,mdns")
+    parser.add_argument("--identify", default="dns,mqtt", help="device identification used by ping, arp and sweep")
+    parser.add_argument("--live-ratio", type=float, default=0.2, help="share of addresses that are alive")
+    parser.add_argument("--devices", type=int, default=10, help="number of dyson devices among the live hosts")
+    parser.add_argument("--latency", type=float, default=0.005, help="round trip time of live hosts in seconds")
+    parser.add_argument("--dns-latency", type=float, default=0.02)
+    parser.add_argument("--dns-failure-rate", type=float, default=0.1)
+    parser.add_argument("--dns-hang-rate", type=float, default=0.01)
+    parser.add_argument("--time-scale", type=float, default=0.01, help="factor applied to all simulated delays")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    columns = ("prefix", "method", "identify", "wall_time", "first_device", "found", "sockets", "peak_sockets", "subprocesses", "lookups", "mqtt_connects", "peak_threads")
+    print(" ".join("{:>12}".format(column) for column in columns))
+    for prefix in (int(prefix) for prefix in args.prefixes.split(",")):
+        for method, identify in ((method, identify) for method in args.methods.split(",") for identify in args.identify.split(",")):
+            if method == "mdns" and identify != args.identify.split(",")[0]:
+                continue
+            random.seed(args.seed)
+            sim = simulate(prefix, args)
+            install(sim, args)
+            result = run(method, sim, identify)
+            row = ["/{}".format(prefix), method, "-" if method == "mdns" else identify]
+            for column in columns[3:]:
+                value = result[column]
+                row.append("{:.3f}".format(value) if isinstance(value, float) else str(value))
+            print(" ".join("{:>12}".format(value) for value in row))
+
+
+if __name__ == '__main__':
+    main()
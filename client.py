@@ -17,34 +17,61 @@
 
 from dyson.configuration import config
 from dyson.device_manager import DeviceManager
+from dyson.device_cache import DeviceCache
 from dyson.discovery.cloud_monitor import CloudMonitor
 from dyson.discovery.local_monitor import LocalMonitor
 from dyson.router import commandRouter
+from dyson.emitter import EventEmitter
+from dyson.spool import Spool
+from dyson.scheduler import scheduler
+from dyson.metrics import logMetrics
 import time, random, cc_lib
 
 
-if config.RuntimeEnv.max_start_delay > 0:
+device_cache = DeviceCache() if config.RuntimeEnv.device_cache else None
+warm_start = device_cache.load() if device_cache else False
+
+
+if config.RuntimeEnv.max_start_delay > 0 and not warm_start:
     delay = random.randint(1, config.RuntimeEnv.max_start_delay)
     print("delaying start for {}s".format(delay))
     time.sleep(delay)
 
 
 device_manager = DeviceManager()
+if warm_start:
+    device_cache.restoreDevices(device_manager)
 
 
 def on_connect(client: cc_lib.client.Client):
+    if spool:
+        spool.setConnected(True)
     devices = device_manager.devices
     for device in devices.values():
         if device.session:
             device.session.connect_device_to_platform()
 
 
+def on_disconnect(client: cc_lib.client.Client):
+    if spool:
+        spool.setConnected(False)
+
+
 connector_client = cc_lib.client.Client()
 connector_client.setConnectClbk(on_connect)
+connector_client.setDisconnectClbk(on_disconnect)
+
 
+if config.Spool.enabled:
+    spool = Spool(connector_client, int(config.Spool.max_items), config.Spool.replay_rate)
+else:
+    spool = None
 
-cloud_monitor = CloudMonitor(device_manager, connector_client)
-local_monitor = LocalMonitor(device_manager, connector_client)
+emitter = EventEmitter(spool or connector_client)
+
+
+cloud_monitor = CloudMonitor(device_manager, connector_client, device_cache)
+local_monitor = LocalMonitor(device_manager, connector_client, device_cache, emitter)
 
 
 if __name__ == '__main__':
@@ -54,10 +81,14 @@ if __name__ == '__main__':
             break
         except cc_lib.client.HubInitializationError:
             time.sleep(10)
+    if spool:
+        spool.start()
+    local_monitor.start()
     connector_client.connect(reconnect=True)
     cloud_monitor.start()
-    local_monitor.start()
+    if config.Logger.metrics_interval > 0:
+        scheduler.schedule(logMetrics, config.Logger.metrics_interval)
     try:
-        commandRouter(connector_client, device_manager)
+        commandRouter(connector_client, device_manager, spool)
     except KeyboardInterrupt:
         print("\ninterrupted by user\n")
@@ -0,0 +1,97 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Field', 'Schema', 'loads', 'dumps', 'json_backend')
+
+
+from .configuration import config
+from .logger import root_logger
+import collections, importlib, json, typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+def loadBackend(name: str) -> typing.Tuple[str, typing.Callable, typing.Callable]:
+    candidates = ("orjson", "ujson", "json") if name in (None, "auto") else (name, "json")
+    for candidate in candidates:
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            if name not in (None, "auto"):
+                logger.warning("json backend '{}' not available".format(candidate))
+            continue
+        if candidate == "orjson":
+            return candidate, module.loads, lambda obj: module.dumps(obj).decode()
+        return candidate, module.loads, module.dumps
+    return "json", json.loads, json.dumps
+
+
+json_backend, loads, dumps = loadBackend(config.RuntimeEnv.json_backend)
+
+
+Field = collections.namedtuple("Field", ("key", "name", "decode", "encode"))
+Field.__new__.__defaults__ = (None,)
+
+
+def compileDecoder(fields: typing.Sequence[Field]) -> typing.Callable[[typing.Mapping], dict]:
+    # all fields are required
+    decoders = tuple((field.name, field.key, field.decode) for field in fields)
+
+    def decode(data):
+        return {name: decoder(data[key]) for name, key, decoder in decoders}
+
+    return decode
+
+
+def compileReadingsDecoder(fields: typing.Sequence[Field], default: typing.Callable) -> typing.Callable[[typing.Mapping], dict]:
+    # devices only report what they measure, unknown keys are converted with the default
+    decoders = {field.key: (field.name, field.decode) for field in fields}
+    fallback = (None, default)
+
+    def decode(data):
+        readings = dict()
+        for key, value in data.items():
+            name, decoder = decoders.get(key, fallback)
+            readings[name or key] = decoder(value)
+        return readings
+
+    return decode
+
+
+class Schema:
+    def __init__(self, state_fields: typing.Sequence[Field], sensor_fields: typing.Sequence[Field], read_only: typing.Sequence[str] = (), defaults: dict = None):
+        self.__encoders = {field.name: (field.key, field.encode) for field in state_fields if field.encode}
+        self.__read_only = tuple(read_only)
+        self.__defaults = dict(defaults or ())
+        self.decodeState = compileDecoder(state_fields)
+        self.decodeReadings = compileReadingsDecoder(sensor_fields, int)
+        self.sensor_fields = tuple(field.name for field in sensor_fields)
+
+    def encode(self, **values) -> dict:
+        state = dict()
+        for name, value in values.items():
+            key, encoder = self.__encoders[name]
+            state[key] = encoder(value)
+        return state
+
+    def fullState(self, state: typing.Mapping, changes: dict) -> dict:
+        data = dict(state)
+        data.update(changes)
+        for key in self.__read_only:
+            data.pop(key, None)
+        data.update(self.__defaults)
+        return data
@@ -37,35 +37,97 @@ class DysonConf:
         auth_endpt = "v1/userregistration/authenticate?country="
         provisioning_endpt = "v1/provisioningservice/manifest"
         poll_interval = 300
+        timeout = 10
+        retry_interval = 30
+        max_backoff = 3600
         user = None
         pw = None
 
     @section
     class Discovery:
         interval = 240
+        method = "sweep"
+        identify = "dns"
+        identify_candidates = 16
+        incremental = True
         ports = "1883;8883"
         ping_timeout = 2
         probe_timeout = 2
+        sweep_concurrency = 256
+        interfaces = None
+        subnets = None
+        exclude = None
+        default_prefix = 24
+        min_prefix = 16
+        chunk_size = 256
+        dns_ttl = 3600
+        dns_negative_ttl = 300
+        dns_cache_size = 1024
+        dns_timeout = 2
+        dns_workers = 16
+        mdns_timeout = 3
+        mdns_refresh = 10
+        mdns_cache_timeout = 60
+        neighbour_refresh = True
+        neighbour_refresh_rate = 200
+        neighbour_settle_time = 1
 
     @section
     class Session:
         sensor_interval = 10
+        adaptive_polling = False
+        sensor_interval_min = 10
+        sensor_interval_max = 120
+        sensor_intervals = None
+        sensor_backoff = 1.5
+        deadband = False
+        deadband_absolute = "tact=0.2;hact=1"
+        deadband_relative = None
+        deadband_heartbeat = 300
+        history_memory = 16384
         keepalive = 5
         logging = False
         max_command_age = 180
+        command_window = 0.2
+        full_state_set = False
+        confirm_commands = False
+        confirm_timeout = 10
+        state_interval = 300
+        jitter = 0.1
+        engine_threads = 1
+        connect_workers = 8
+
+    @section
+    class Router:
+        workers = 8
+        max_pending = 256
+        max_device_pending = 32
+        read_share = 4
+
+    @section
+    class Spool:
+        enabled = True
+        max_items = 100000
+        replay_rate = 50
 
     @section
     class RuntimeEnv:
         container = False
         max_start_delay = 30
+        device_cache = True
+        json_backend = "auto"
 
     @section
     class Logger:
         level = "info"
+        metrics_interval = 0
+        latency_buckets = "0.05;0.1;0.25;0.5;1;2.5;5;10;30"
 
     @section
     class Senergy:
         dt_pure_cool_link = None
+        dt_pure_cool_link_desk = None
+        dt_pure_hot_cool_link = None
 
 
 if not os.path.exists(user_dir):
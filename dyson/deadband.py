@@ -0,0 +1,72 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Deadband', 'parseThresholds')
+
+
+from .logger import root_logger
+import typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+def parseThresholds(value) -> dict:
+    # "<field>=<threshold>;...", "*" applies to all other fields
+    thresholds = dict()
+    for item in str(value or "").split(";"):
+        if not item.strip():
+            continue
+        try:
+            key, threshold = item.split("=", 1)
+            thresholds[key.strip()] = abs(float(threshold))
+        except ValueError:
+            logger.error("invalid threshold '{}'".format(item))
+    return thresholds
+
+
+class Deadband:
+    def __init__(self, absolute: dict, relative: dict, heartbeat: float, ignore: typing.Sequence[str] = ("time",)):
+        self.__absolute = absolute
+        self.__relative = relative
+        self.__heartbeat = heartbeat
+        self.__ignore = frozenset(ignore)
+        self.__last = None
+        self.__last_time = 0
+
+    def __exceeds(self, key, value, last) -> bool:
+        try:
+            delta = abs(value - last)
+        except TypeError:
+            return value != last
+        # a change has to leave the wider of both bands, fields without thresholds pass on any change
+        band = max(
+            self.__absolute.get(key, self.__absolute.get("*", 0)),
+            self.__relative.get(key, self.__relative.get("*", 0)) * abs(last)
+        )
+        return delta > band if band else delta != 0
+
+    def check(self, readings: dict, now: float) -> bool:
+        values = {key: value for key, value in readings.items() if key not in self.__ignore}
+        last = self.__last
+        if last is None or now - self.__last_time >= self.__heartbeat or values.keys() != last.keys() or any(self.__exceeds(key, value, last[key]) for key, value in values.items()):
+            self.__last = values
+            self.__last_time = now
+            return True
+        return False
+
+    def reset(self):
+        self.__last = None
@@ -0,0 +1,96 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('DeviceCache',)
+
+
+from .configuration import user_dir
+from .logger import root_logger
+from .device_manager import DeviceManager
+from .types.device import device_type_map
+from threading import Lock
+import os, json
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class DeviceCache:
+    def __init__(self, file_name: str = "devices.json"):
+        self.__path = os.path.join(user_dir, file_name)
+        self.__lock = Lock()
+        self.__devices = dict()
+        self.__addresses = dict()
+
+    def load(self) -> bool:
+        try:
+            with open(self.__path) as file:
+                data = json.load(file)
+            with self.__lock:
+                self.__devices = data.get("devices", dict())
+                self.__addresses = {key: tuple(value) for key, value in data.get("addresses", dict()).items()}
+            logger.info("loaded {} cached devices".format(len(self.__devices)))
+            return bool(self.__devices)
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            logger.error("could not load device cache - {}".format(ex))
+        return False
+
+    def __write(self):
+        tmp_path = "{}.tmp".format(self.__path)
+        try:
+            # holds device credentials
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump({"devices": self.__devices, "addresses": self.__addresses}, file)
+            os.replace(tmp_path, self.__path)
+        except Exception as ex:
+            logger.error("could not write device cache - {}".format(ex))
+
+    @property
+    def devices(self) -> dict:
+        with self.__lock:
+            return self.__devices.copy()
+
+    @property
+    def addresses(self) -> dict:
+        with self.__lock:
+            return self.__addresses.copy()
+
+    def setDevices(self, queried_devices: dict):
+        devices = {key: {**value[0], **value[1]} for key, value in queried_devices.items()}
+        with self.__lock:
+            if devices != self.__devices:
+                self.__devices = devices
+                self.__addresses = {key: value for key, value in self.__addresses.items() if key in devices}
+                self.__write()
+
+    def setAddresses(self, addresses: dict):
+        addresses = {key: tuple(value) for key, value in addresses.items()}
+        with self.__lock:
+            if addresses != self.__addresses:
+                self.__addresses = addresses
+                self.__write()
+
+    def restoreDevices(self, device_manager: DeviceManager):
+        for device_id, attributes in self.devices.items():
+            try:
+                device = device_type_map[attributes["type"]](device_id, attributes["pw"], name=attributes["name"])
+                device_manager.add(device)
+            except Exception as ex:
+                logger.warning("could not restore '{}' - {}".format(device_id, ex))
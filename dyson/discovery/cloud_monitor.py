@@ -17,24 +17,47 @@
 from ..configuration import config
 from ..logger import root_logger
 from ..device_manager import DeviceManager
+from ..device_cache import DeviceCache
 from ..types.device import device_type_map
-import time, requests, cc_lib
+from ..codec import loads
+import time, random, hashlib, typing, requests, requests.adapters, cc_lib
 from threading import Thread
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
+def createSession() -> requests.Session:
+    # keeps the tls connection to the dyson cloud alive between polls
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = createSession()
+
+
+class ManifestError(Exception):
+    pass
+
+
 def getApiCredentials():
     body = {
         "Email": config.Account.email,
         "Password": config.Account.pw
     }
-    http_resp = requests.post(
-        url="https://{}/{}{}".format(config.Cloud.host, config.Cloud.auth_endpt, config.Account.country),
-        json=body,
-        verify=False
-    )
+    try:
+        http_resp = http_session.post(
+            url="https://{}/{}{}".format(config.Cloud.host, config.Cloud.auth_endpt, config.Account.country),
+            json=body,
+            verify=False,
+            timeout=config.Cloud.timeout
+        )
+    except requests.RequestException as ex:
+        logger.error("could not retrieve dyson cloud credentials - {}".format(ex))
+        return False
     if http_resp.status_code == 200:
         credentials = http_resp.json()
         config.Cloud.user = credentials.get('Account')
@@ -45,28 +68,43 @@ def getApiCredentials():
     return False
 
 
-def apiQueryDevices():
-    unknown_devices = dict()
-    http_resp = requests.get(
+def apiQueryManifest(etag: str = None) -> typing.Tuple[typing.Optional[bytes], typing.Optional[str]]:
+    # returns no content if the manifest did not change since the given etag
+    http_resp = http_session.get(
         url="https://{}/{}".format(config.Cloud.host, config.Cloud.provisioning_endpt),
         auth=(config.Cloud.user, config.Cloud.pw),
-        verify=False
+        headers={"If-None-Match": etag} if etag else None,
+        verify=False,
+        timeout=config.Cloud.timeout
     )
-    if http_resp.status_code == 200:
-        devices = http_resp.json()
-        for device in devices:
-            try:
-                unknown_devices[device['Serial']] = (
-                    {
-                        "name": device["Name"]
-                    },
-                    {
-                        "type": device["ProductType"],
-                        "pw": device["LocalCredentials"]
-                    }
-                )
-            except KeyError:
-                logger.error("missing device serial or malformed message - '{}'".format(device))
+    if http_resp.status_code == 304:
+        return None, etag
+    if http_resp.status_code == 401:
+        getApiCredentials()
+    if http_resp.status_code != 200:
+        raise ManifestError("'{}'".format(http_resp.status_code))
+    return http_resp.content, http_resp.headers.get("ETag")
+
+
+def parseManifest(content: bytes) -> dict:
+    unknown_devices = dict()
+    for device in loads(content):
+        try:
+            device_type = device_type_map.get(device["ProductType"])
+            if not device_type or not device_type.device_type_id:
+                logger.warning("'{}' with type '{}' not supported".format(device["Serial"], device["ProductType"]))
+                continue
+            unknown_devices[device['Serial']] = (
+                {
+                    "name": device["Name"]
+                },
+                {
+                    "type": device["ProductType"],
+                    "pw": device["LocalCredentials"]
+                }
+            )
+        except KeyError:
+            logger.error("missing device serial or malformed message - '{}'".format(device))
     return unknown_devices
 
 
@@ -80,10 +118,41 @@ def diff(known, unknown):
 
 
 class CloudMonitor(Thread):
-    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client):
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, device_cache: DeviceCache = None):
         super().__init__(name=__class__.__name__, daemon=True)
         self.__device_manager = device_manager
         self.__client = client
+        self.__device_cache = device_cache
+        self.__synced = False
+        self.__etag = None
+        self.__digest = None
+        self.__failures = 0
+
+    def __backoff(self) -> float:
+        delay = min(config.Cloud.retry_interval * 2 ** (self.__failures - 1), config.Cloud.max_backoff)
+        return delay * random.uniform(0.9, 1.1)
+
+    def __poll(self):
+        content, etag = apiQueryManifest(self.__etag)
+        if content is None:
+            logger.debug("device manifest not modified")
+            return
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.__digest:
+            logger.debug("device manifest unchanged")
+            self.__etag = etag
+            return
+        unknown_devices = parseManifest(content)
+        self.__evaluate(unknown_devices)
+        if self.__device_cache:
+            self.__device_cache.setDevices(unknown_devices)
+        # only skip the next evaluation if all devices made it onto the platform
+        if not any(diff(self.__device_manager.devices, unknown_devices)):
+            self.__digest = digest
+            self.__etag = etag
+        else:
+            self.__digest = None
+            self.__etag = None
 
     def run(self):
         if not (config.Cloud.user and config.Cloud.pw):
@@ -91,9 +160,15 @@ class CloudMonitor(Thread):
                 logger.info("retry in 30s")
                 time.sleep(30)
         while True:
-            unknown_devices = apiQueryDevices()
-            self.__evaluate(unknown_devices)
-            time.sleep(config.Cloud.poll_interval)
+            try:
+                self.__poll()
+                self.__failures = 0
+                delay = config.Cloud.poll_interval
+            except Exception as ex:
+                self.__failures += 1
+                delay = self.__backoff()
+                logger.error("could not query devices - {} - retry in {}s".format(ex, round(delay)))
+            time.sleep(delay)
 
     def __evaluate(self, queried_devices):
         missing_devices, new_devices, changed_devices = diff(self.__device_manager.devices, queried_devices)
@@ -139,7 +214,9 @@ class CloudMonitor(Thread):
                     future.result()
                 except cc_lib.client.DeviceUpdateError:
                     device.name = prev_device_name
-        if any((missing_devices, new_devices, changed_devices)):
+        # devices restored from cache have not been synced with the platform yet
+        if any((missing_devices, new_devices, changed_devices)) or not self.__synced:
+            self.__synced = True
             try:
                 self.__client.syncHub(list(self.__device_manager.devices.values()), asynchronous=True)
             except cc_lib.client.HubError:
@@ -0,0 +1,154 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Fingerprinter', 'connectPacket')
+
+
+from ..configuration import config
+from ..logger import root_logger
+from .resolver import resolver
+from threading import Lock
+import asyncio, struct, uuid, typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+CONNACK = 0x20
+DISCONNECT = b"\xe0\x00"
+
+
+def encodeString(value: str) -> bytes:
+    value = value.encode()
+    return struct.pack("!H", len(value)) + value
+
+
+def encodeLength(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length = length // 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def connectPacket(client_id: str, username: str, password: str, keepalive: int = 5) -> bytes:
+    # mqtt 3.1.1, clean session, username and password set
+    variable_header = encodeString("MQTT") + struct.pack("!BBH", 4, 0xc2, keepalive)
+    payload = encodeString(client_id) + encodeString(username) + encodeString(password)
+    return b"\x10" + encodeLength(len(variable_header) + len(payload)) + variable_header + payload
+
+
+class Fingerprinter:
+    def __init__(self, credentials: typing.Dict[str, str]):
+        self.__credentials = credentials.copy()
+        self.__lock = Lock()
+
+    async def __candidates(self, host) -> list:
+        # a reverse dns hint goes first, without one a broker gets at most identify_candidates credentials
+        with self.__lock:
+            credentials = list(self.__credentials)
+        limit = max(0, int(config.Discovery.identify_candidates))
+        hostname = await resolver.resolveAsync(host)
+        if hostname:
+            hint = hostname.upper().split(".", 1)[0]
+            if hint in credentials:
+                credentials.remove(hint)
+                return [hint] + credentials[:limit]
+        return credentials[:limit]
+
+    async def __open(self, host, port):
+        return await asyncio.wait_for(asyncio.open_connection(host, port), config.Discovery.probe_timeout)
+
+    async def __openAny(self, host, ports):
+        # connect to all ports at once and keep the first connection established
+        tasks = {asyncio.ensure_future(self.__open(host, port)): port for port in ports}
+        pending = set(tasks)
+        port, connection = None, None
+        while pending and not connection:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    continue
+                if connection:
+                    task.result()[1].close()
+                else:
+                    port, connection = tasks[task], task.result()
+        for task in pending:
+            task.cancel()
+        return port, connection
+
+    async def __authenticate(self, connection, username, password) -> typing.Optional[int]:
+        reader, writer = connection
+        try:
+            writer.write(connectPacket("dyson-connector-{}".format(uuid.uuid4().hex[:8]), username, password))
+            await writer.drain()
+            packet = await asyncio.wait_for(reader.readexactly(4), config.Discovery.probe_timeout)
+            if packet[0] != CONNACK:
+                return None
+            if packet[3] == 0:
+                writer.write(DISCONNECT)
+                await writer.drain()
+            return packet[3]
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None
+        finally:
+            writer.close()
+
+    async def identify(self, host, ports) -> typing.Optional[typing.Tuple[str, int]]:
+        with self.__lock:
+            if not self.__credentials:
+                return None
+        port, connection = await self.__openAny(host, ports)
+        if not connection:
+            return None
+        # check with random credentials before any real password is sent
+        rc = await self.__authenticate(connection, uuid.uuid4().hex, uuid.uuid4().hex)
+        if rc is None:
+            # not a mqtt broker
+            return None
+        if rc == 0:
+            logger.debug("broker at '{}' accepts any credentials".format(host))
+            return None
+        # only hosts running a broker are resolved
+        candidates = await self.__candidates(host)
+        for device_id in candidates:
+            with self.__lock:
+                password = self.__credentials.get(device_id)
+            if password is None:
+                continue
+            try:
+                connection = await self.__open(host, port)
+            except (OSError, asyncio.TimeoutError):
+                return None
+            rc = await self.__authenticate(connection, device_id, password)
+            if rc is None:
+                return None
+            if rc == 0:
+                with self.__lock:
+                    self.__credentials.pop(device_id, None)
+                return device_id, port
+        return None
+
+    def identifyBlocking(self, host, ports) -> typing.Optional[typing.Tuple[str, int]]:
+        try:
+            return asyncio.run(self.identify(host, ports))
+        except Exception as ex:
+            logger.error("could not identify '{}' - {}".format(host, ex))
+            return None
@@ -18,9 +18,16 @@
 from ..configuration import config
 from ..logger import root_logger
 from ..device_manager import DeviceManager
+from ..device_cache import DeviceCache
 from ..session import Session
-# from libpurecoollink.zeroconf import ServiceBrowser, Zeroconf, get_all_addresses
-import time, threading, cc_lib, socket, os, platform, subprocess
+from ..emitter import EventEmitter
+from ..util import decrypt_password
+from .sweep import sweepHosts, verifyHosts
+from .network import iterLocalAddresses, iterChunks
+from .resolver import resolver
+from .neighbours import discoverNeighbours
+from .fingerprint import Fingerprinter
+import time, threading, cc_lib, socket, subprocess, queue
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
@@ -32,63 +39,24 @@ probe_ports = [int(port) for port in str(config.Discovery.ports).split(";")]
 def ping(host) -> bool:
     return subprocess.call(['ping', '-c', '2', '-t', str(config.Discovery.ping_timeout), host], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
 
-def getLocalIP() -> str:
-    try:
-        if config.RuntimeEnv.container:
-            host_ip = os.getenv("HOST_IP")
-            if not host_ip:
-                raise Exception("environment variable 'HOST_IP' not set")
-            return host_ip
-        else:
-            sys_type = platform.system().lower()
-            if 'linux' in sys_type:
-                local_ip = subprocess.check_output(['hostname', '-I']).decode()
-                local_ip = local_ip.replace(' ', '')
-                local_ip = local_ip.replace('\n', '')
-                return local_ip
-            elif 'darwin' in sys_type:
-                local_ip = socket.gethostbyname(socket.getfqdn())
-                if type(local_ip) is str and local_ip.count('.') == 3:
-                    return local_ip
-            else:
-                raise Exception("platform not supported")
-    except Exception as ex:
-        logger.critical("could not get local ip - {}".format(ex))
-
-def getIpRange(local_ip) -> list:
-    split_ip = local_ip.rsplit('.', 1)
-    base_ip = split_ip[0] + '.'
-    if len(split_ip) > 1:
-        ip_range = [str(base_ip) + str(i) for i in range(2,255)]
-        ip_range.remove(local_ip)
-        return ip_range
-    return list()
-
-def discoverHostsWorker(ip_range, alive_hosts):
+def discoverHostsWorker(ip_range, alive_hosts, callback=None):
     for ip in ip_range:
         if ping(ip):
             alive_hosts.append(ip)
+            if callback:
+                callback(ip)
 
-def discoverHosts() -> list:
+def discoverHosts(callback=None) -> list:
     alive_hosts = list()
-    host_ip = getLocalIP()
-    if host_ip:
-        ip_range = getIpRange(host_ip)
+    bin_size = 3
+    for ip_range in iterChunks(iterLocalAddresses(), int(config.Discovery.chunk_size)):
         workers = list()
-        bin = 0
-        bin_size = 3
-        if ip_range:
-            for i in range(int(len(ip_range) / bin_size)):
-                worker = threading.Thread(target=discoverHostsWorker, name='discoverHostsWorker', args=(ip_range[bin:bin+bin_size], alive_hosts), daemon=True)
-                workers.append(worker)
-                worker.start()
-                bin = bin + bin_size
-            if ip_range[bin:]:
-                worker = threading.Thread(target=discoverHostsWorker, name='discoverHostsWorker', args=(ip_range[bin:], alive_hosts), daemon=True)
-                workers.append(worker)
-                worker.start()
-            for worker in workers:
-                worker.join()
+        for bin in range(0, len(ip_range), bin_size):
+            worker = threading.Thread(target=discoverHostsWorker, name='discoverHostsWorker', args=(ip_range[bin:bin+bin_size], alive_hosts, callback), daemon=True)
+            workers.append(worker)
+            worker.start()
+        for worker in workers:
+            worker.join()
     return alive_hosts
 
 def probeHost(host, port) -> bool:
@@ -101,37 +69,92 @@ def probeHost(host, port) -> bool:
     except OSError:
         return False
 
-def validateHostsWorker(hosts, valid_hosts):
+def validateHostsWorker(hosts, hostnames, valid_hosts, callback=None, fingerprinter=None):
     for host in hosts:
-        hostname = socket.getfqdn(host)
-        if hostname and hostname is not host:
-            for port in probe_ports:
-                if probeHost(host, port):
-                    valid_hosts[hostname.upper().split(".", 1)[0]] = (host, port)
+        if fingerprinter:
+            result = fingerprinter.identifyBlocking(host, probe_ports)
+            if result:
+                device_id, port = result
+                valid_hosts[device_id] = (host, port)
+                if callback:
+                    callback(device_id, (host, port))
+            continue
+        for port in probe_ports:
+            if probeHost(host, port):
+                device_id = hostnames[host].upper().split(".", 1)[0]
+                valid_hosts[device_id] = (host, port)
+                if callback:
+                    callback(device_id, (host, port))
+                break
+
+def validateHost(host, callback=None, fingerprinter=None) -> dict:
+    valid_hosts = dict()
+    hostnames = resolver.resolveMany((host,)) if not fingerprinter else None
+    if fingerprinter or hostnames[host]:
+        validateHostsWorker((host,), hostnames, valid_hosts, callback, fingerprinter)
+    return valid_hosts
 
-def validateHosts(hosts) -> dict:
+def validateHosts(hosts, callback=None, fingerprinter=None) -> dict:
     valid_hosts = dict()
+    if fingerprinter:
+        hostnames = None
+    else:
+        hostnames = resolver.resolveMany(hosts)
+        hosts = [host for host in hosts if hostnames[host]]
     workers = list()
     bin = 0
     bin_size = 2
     if len(hosts) <= bin_size:
-        worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts, valid_hosts), daemon=True)
+        worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts, hostnames, valid_hosts, callback, fingerprinter), daemon=True)
         workers.append(worker)
         worker.start()
     else:
         for i in range(int(len(hosts) / bin_size)):
-            worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:bin + bin_size], valid_hosts), daemon=True)
+            worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:bin + bin_size], hostnames, valid_hosts, callback, fingerprinter), daemon=True)
             workers.append(worker)
             worker.start()
             bin = bin + bin_size
         if hosts[bin:]:
-            worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:], valid_hosts), daemon=True)
+            worker = threading.Thread(target=validateHostsWorker, name='validateHostsWorker', args=(hosts[bin:], hostnames, valid_hosts, callback, fingerprinter), daemon=True)
             workers.append(worker)
             worker.start()
     for worker in workers:
         worker.join()
     return valid_hosts
 
+def discoverDevicesPing(callback, fingerprinter=None):
+    discoverHosts(lambda host: validateHost(host, callback, fingerprinter))
+
+def discoverDevicesArp(callback, fingerprinter=None):
+    validateHosts(discoverNeighbours(), callback, fingerprinter)
+
+def discoverDevicesSweep(callback, fingerprinter=None):
+    sweepHosts(iterLocalAddresses(), probe_ports, callback, fingerprinter)
+
+discovery_methods = {
+    "ping": discoverDevicesPing,
+    "arp": discoverDevicesArp,
+    "sweep": discoverDevicesSweep
+}
+
+def streamDevices(method, fingerprinter=None):
+    devices = queue.Queue()
+
+    def target():
+        try:
+            discovery_methods.get(method, discoverDevicesSweep)(lambda device_id, address: devices.put((device_id, address)), fingerprinter)
+        except Exception as ex:
+            logger.error("device discovery failed - {}".format(ex))
+        finally:
+            devices.put(None)
+
+    threading.Thread(target=target, name="discoverDevices", daemon=True).start()
+    while True:
+        item = devices.get()
+        if item is None:
+            break
+        yield item
+
 def diff(known: dict, unknown: dict):
     known_set = set(known)
     unknown_set = set(unknown)
@@ -142,54 +165,123 @@ def diff(known: dict, unknown: dict):
 
 
 class LocalMonitor(threading.Thread):
-    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client):
+    def __init__(self, device_manager: DeviceManager, client: cc_lib.client.Client, device_cache: DeviceCache = None, emitter: EventEmitter = None):
         super().__init__(name=__class__.__name__, daemon=True)
         self.__device_manager = device_manager
         self.__client = client
+        self.__emitter = emitter
+        self.__device_cache = device_cache
         self.__devices_cache = dict()
+        self.__evaluate_lock = threading.Lock()
+        self.__mdns_devices = dict()
+        self.__mdns_lock = threading.Lock()
+        self.__cached_devices = dict()
+        self.__cache_deadline = 0
 
     def run(self) -> None:
+        if self.__device_cache:
+            registered_ids = self.__device_manager.devices.keys()
+            cached_devices = {id: address for id, address in self.__device_cache.addresses.items() if id in registered_ids}
+            if cached_devices:
+                logger.info("starting sessions for {} cached devices".format(len(cached_devices)))
+                self.__evaluate(cached_devices)
+                with self.__mdns_lock:
+                    self.__cached_devices = cached_devices
+                    self.__cache_deadline = time.monotonic() + config.Discovery.mdns_cache_timeout
+        if config.Discovery.method == "mdns" and self.__runServiceBrowser() is False:
+            logger.warning("falling back to sweep discovery")
         while True:
-            devices = self.__discoverDevices()
+            devices = None
+            if config.Discovery.incremental:
+                devices = self.__verifyDevices()
+            if devices is None:
+                devices = self.__discoverDevices()
             self.__evaluate(devices)
             time.sleep(config.Discovery.interval)
 
-    # def remove_service(self, zeroconf, type, name):
-    #     pass
-    #     # SessionManager.delLocalDevice(name.split(".")[0].split("_")[1])
-    #
-    # def add_service(self, zeroconf, type, name):
-    #     info = zeroconf.get_service_info(type, name)
-    #     device_id = info.name.split(".")[0].split("_")[1]
-    #     device_ip = socket.inet_ntoa(info.address)
-    #     device_port = info.port
-    #     logger.debug("discovered '{}': {}".format(name, info))
-    #     self.__devices_buffer[device_id] = {
-    #         "ip": device_ip,
-    #         "port": device_port
-    #     }
-    #     # logger.info("found local device with id '{}' on '{}:{}'".format(device_id, device_ip, device_port))
-    #     # SessionManager.addLocalDevice(info.name.split(".")[0].split("_")[1], device_ip, device_port)
-
-    # def __discoverDevices(self):
-    #     logger.debug("running local device discovery for {}s".format(config.Local.discovery_duration))
-    #     zeroconf = Zeroconf()
-    #     service_browser = ServiceBrowser(zeroconf, "_dyson_mqtt._tcp.local.", self)
-    #     time.sleep(config.Local.discovery_duration)
-    #     zeroconf.close()
-    #     service_browser.join()
-    #     logger.debug("local device discovery completed")
+    def __onServiceEvent(self, device_id, address):
+        with self.__mdns_lock:
+            self.__cached_devices.pop(device_id, None)
+            if address:
+                self.__mdns_devices[device_id] = address
+            else:
+                self.__mdns_devices.pop(device_id, None)
+        self.__evaluateServices()
+
+    def __evaluateServices(self):
+        registered_ids = self.__device_manager.devices.keys()
+        with self.__mdns_lock:
+            devices = {id: self.__mdns_devices[id] for id in registered_ids if id in self.__mdns_devices}
+            if self.__cached_devices:
+                # cached devices keep their sessions until announced or timed out
+                if time.monotonic() < self.__cache_deadline:
+                    for device_id, address in self.__cached_devices.items():
+                        if device_id in registered_ids:
+                            devices.setdefault(device_id, address)
+                else:
+                    self.__cached_devices.clear()
+        self.__evaluate(devices)
+
+    def __runServiceBrowser(self) -> bool:
+        try:
+            from .mdns import MDNSBrowser
+        except ImportError as ex:
+            logger.error("mdns discovery not available - {}".format(ex))
+            return False
+        browser = MDNSBrowser(self.__onServiceEvent)
+        browser.start()
+        try:
+            while True:
+                # picks up devices registered after their announcement
+                time.sleep(config.Discovery.mdns_refresh)
+                self.__evaluateServices()
+        finally:
+            browser.stop()
+
+    def __verifyDevices(self):
+        registered_ids = self.__device_manager.devices.keys()
+        if not registered_ids or any(id not in self.__devices_cache for id in registered_ids):
+            return None
+        logger.debug("verifying known devices ...")
+        devices = verifyHosts({id: self.__devices_cache[id] for id in registered_ids})
+        if len(devices) < len(registered_ids):
+            logger.debug("known devices unreachable - falling back to device discovery")
+            return None
+        logger.debug("known devices verified")
+        return devices
+
+    def __getCredentials(self) -> dict:
+        credentials = dict()
+        for device_id, device in self.__device_manager.devices.items():
+            try:
+                credentials[device_id] = decrypt_password(device.pw)
+            except Exception as ex:
+                logger.error("could not decrypt credentials of '{}' - {}".format(device_id, ex))
+        return credentials
 
     def __discoverDevices(self):
         logger.debug("running device discovery ...")
-        hosts = validateHosts(discoverHosts())
-        registered_ids = self.__device_manager.devices.keys()
-        devices = {id: hosts[id] for id in registered_ids if id in hosts}
+        devices = dict()
+        fingerprinter = None
+        if config.Discovery.identify == "mqtt":
+            fingerprinter = Fingerprinter(self.__getCredentials())
+        for device_id, address in streamDevices(config.Discovery.method, fingerprinter):
+            if device_id in self.__device_manager.devices:
+                devices[device_id] = address
+                # start sessions right away instead of waiting for the whole sweep
+                self.__evaluate({device_id: address}, partial=True)
         logger.debug("device discovery completed")
         return devices
 
-    def __evaluate(self, discovered_devices):
+    def __evaluate(self, discovered_devices, partial=False):
+        with self.__evaluate_lock:
+            self.__evaluateDevices(discovered_devices, partial)
+
+    def __evaluateDevices(self, discovered_devices, partial):
         missing_devices, new_devices, changed_devices = diff(self.__devices_cache, discovered_devices)
+        if partial:
+            missing_devices = set()
+            discovered_devices = {**self.__devices_cache, **discovered_devices}
         if missing_devices:
             for device_id in missing_devices:
                 logger.info("can't find '{}' at '{}'".format(device_id, self.__devices_cache[device_id]))
@@ -203,16 +295,20 @@ class LocalMonitor(threading.Thread):
             for device_id in new_devices:
                 logger.info("found '{}' at '{}' on '{}'".format(device_id, discovered_devices[device_id][0], discovered_devices[device_id][1]))
                 device = self.__device_manager.get(device_id)
-                device.session = Session(self.__client, device.model_num, device.id, device.pw, discovered_devices[device_id][0], discovered_devices[device_id][1])
+                device.session = Session(self.__client, device.model_num, device.id, device.pw, discovered_devices[device_id][0], discovered_devices[device_id][1], self.__emitter)
                 device.session.setSensorDataService(device.getService("getSensorReadings"))
+                device.session.setDeviceStateService(device.getService("getDeviceState"))
                 device.session.start()
         if changed_devices:
             for device_id in changed_devices:
                 logger.info("address of '{}' changed to '{}'".format(device_id, discovered_devices[device_id]))
                 device = self.__device_manager.get(device_id)
                 device.session.stop()
-                device.session = Session(self.__client, device.model_num, device.id, device.pw, discovered_devices[device_id][0], discovered_devices[device_id][1])
+                device.session = Session(self.__client, device.model_num, device.id, device.pw, discovered_devices[device_id][0], discovered_devices[device_id][1], self.__emitter)
                 device.session.setSensorDataService(device.getService("getSensorReadings"))
+                device.session.setDeviceStateService(device.getService("getDeviceState"))
                 device.session.start()
         if any((missing_devices, new_devices, changed_devices)):
             self.__devices_cache = discovered_devices
+            if self.__device_cache:
+                self.__device_cache.setAddresses(discovered_devices)
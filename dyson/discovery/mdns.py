@@ -0,0 +1,75 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('MDNSBrowser', 'service_type')
+
+
+from ..configuration import config
+from ..logger import root_logger
+from zeroconf import Zeroconf, ServiceBrowser, ServiceListener, IPVersion
+import typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+service_type = "_dyson_mqtt._tcp.local."
+
+
+def getDeviceId(name: str) -> str:
+    # <model number>_<serial>._dyson_mqtt._tcp.local.
+    return name.split(".", 1)[0].split("_", 1)[-1].upper()
+
+
+class MDNSBrowser(ServiceListener):
+    def __init__(self, callback: typing.Callable[[str, typing.Optional[tuple]], None]):
+        self.__callback = callback
+        self.__zeroconf = None
+        self.__browser = None
+
+    def start(self):
+        logger.debug("starting mdns browser for '{}' ...".format(service_type))
+        self.__zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
+        self.__browser = ServiceBrowser(self.__zeroconf, service_type, self)
+
+    def stop(self):
+        if self.__zeroconf:
+            self.__browser.cancel()
+            self.__zeroconf.close()
+            self.__zeroconf = None
+            self.__browser = None
+
+    def __resolve(self, zc: Zeroconf, type_: str, name: str):
+        info = zc.get_service_info(type_, name, timeout=int(config.Discovery.mdns_timeout * 1000))
+        if not info:
+            logger.warning("could not resolve '{}'".format(name))
+            return
+        addresses = info.parsed_addresses(IPVersion.V4Only)
+        if not addresses:
+            logger.warning("no address for '{}'".format(name))
+            return
+        logger.debug("resolved '{}' to '{}' on '{}'".format(name, addresses[0], info.port))
+        self.__callback(getDeviceId(name), (addresses[0], info.port))
+
+    def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        self.__resolve(zc, type_, name)
+
+    def update_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        self.__resolve(zc, type_, name)
+
+    def remove_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+        logger.debug("'{}' removed".format(name))
+        self.__callback(getDeviceId(name), None)
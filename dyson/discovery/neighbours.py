@@ -0,0 +1,83 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('readNeighbourTable', 'refreshNeighbourTable', 'discoverNeighbours')
+
+
+from ..configuration import config
+from ..logger import root_logger
+from .network import getLocalInterfaces, getLocalNetworks, getExclusions, iterAddresses
+import socket, time, ipaddress
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+arp_table = "/proc/net/arp"
+
+# entry has a resolved link layer address
+ATF_COM = 0x02
+
+
+def readNeighbourTable(networks=None) -> list:
+    hosts = list()
+    excluded = getExclusions()
+    with open(arp_table) as file:
+        next(file)
+        for line in file:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+            ip, hw_type, flags, hw_addr = fields[:4]
+            if not int(flags, 16) & ATF_COM or hw_addr == "00:00:00:00:00:00":
+                continue
+            address = ipaddress.IPv4Address(ip)
+            if networks and not any(address in network for network in networks):
+                continue
+            if any(address in exclusion for exclusion in excluded):
+                continue
+            hosts.append(ip)
+    return hosts
+
+
+def refreshNeighbourTable(addresses, rate: int):
+    # a single datagram per address makes the kernel resolve and cache its link layer address
+    interval = 1 / rate if rate > 0 else 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setblocking(False)
+        for address in addresses:
+            try:
+                s.sendto(b"", (address, 9))
+            except OSError:
+                pass
+            if interval:
+                time.sleep(interval)
+
+
+def discoverNeighbours() -> list:
+    interfaces = getLocalInterfaces()
+    networks = getLocalNetworks(interfaces)
+    try:
+        if config.Discovery.neighbour_refresh:
+            logger.debug("refreshing neighbour table ...")
+            refreshNeighbourTable(iterAddresses(networks, interfaces), int(config.Discovery.neighbour_refresh_rate))
+            time.sleep(config.Discovery.neighbour_settle_time)
+        hosts = readNeighbourTable(networks)
+    except OSError as ex:
+        logger.error("could not read neighbour table - {}".format(ex))
+        return list()
+    logger.debug("found {} neighbours".format(len(hosts)))
+    return hosts
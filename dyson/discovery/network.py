@@ -0,0 +1,144 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('getLocalInterfaces', 'getLocalNetworks', 'getExclusions', 'iterAddresses', 'iterLocalAddresses', 'iterChunks')
+
+
+from ..configuration import config
+from ..logger import root_logger
+import socket, os, platform, struct, ipaddress, itertools
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+
+
+def splitConfValue(value) -> list:
+    if not value:
+        return list()
+    return [item.strip() for item in str(value).replace(",", ";").split(";") if item.strip()]
+
+
+def ifaceIoctl(sock, request, name) -> str:
+    import fcntl
+    return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), request, struct.pack('256s', name.encode()[:15]))[20:24])
+
+
+def getLinuxInterfaces() -> list:
+    interfaces = list()
+    allowed = splitConfValue(config.Discovery.interfaces)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for index, name in socket.if_nameindex():
+            if allowed and name not in allowed:
+                continue
+            try:
+                address = ifaceIoctl(s, SIOCGIFADDR, name)
+                netmask = ifaceIoctl(s, SIOCGIFNETMASK, name)
+            except OSError:
+                # interface down or without ipv4 address
+                continue
+            interface = ipaddress.IPv4Interface("{}/{}".format(address, netmask))
+            if not interface.is_loopback:
+                interfaces.append(interface)
+    return interfaces
+
+
+def getLocalInterfaces() -> list:
+    try:
+        if config.RuntimeEnv.container:
+            host_ip = os.getenv("HOST_IP")
+            if not host_ip:
+                raise Exception("environment variable 'HOST_IP' not set")
+            interfaces = list()
+            for address in splitConfValue(host_ip.replace(" ", ";")):
+                if "/" not in address:
+                    address = "{}/{}".format(address, config.Discovery.default_prefix)
+                interfaces.append(ipaddress.IPv4Interface(address))
+            return interfaces
+        sys_type = platform.system().lower()
+        if 'linux' in sys_type:
+            return getLinuxInterfaces()
+        elif 'darwin' in sys_type:
+            local_ip = socket.gethostbyname(socket.getfqdn())
+            return [ipaddress.IPv4Interface("{}/{}".format(local_ip, config.Discovery.default_prefix))]
+        else:
+            raise Exception("platform not supported")
+    except Exception as ex:
+        logger.critical("could not get local interfaces - {}".format(ex))
+    return list()
+
+
+def getLocalNetworks(interfaces=None) -> list:
+    if interfaces is None:
+        interfaces = getLocalInterfaces()
+    subnets = splitConfValue(config.Discovery.subnets)
+    if subnets:
+        networks = list()
+        for subnet in subnets:
+            try:
+                networks.append(ipaddress.IPv4Network(subnet, strict=False))
+            except ValueError as ex:
+                logger.error("invalid subnet '{}' - {}".format(subnet, ex))
+    else:
+        networks = [interface.network for interface in interfaces]
+    valid_networks = list()
+    for network in ipaddress.collapse_addresses(networks):
+        if network.prefixlen < int(config.Discovery.min_prefix):
+            logger.warning(
+                "skipping '{}' - prefix shorter than /{}".format(network, config.Discovery.min_prefix)
+            )
+        else:
+            valid_networks.append(network)
+    return valid_networks
+
+
+def getExclusions() -> list:
+    excluded = list()
+    for item in splitConfValue(config.Discovery.exclude):
+        try:
+            excluded.append(ipaddress.IPv4Network(item, strict=False))
+        except ValueError as ex:
+            logger.error("invalid exclusion '{}' - {}".format(item, ex))
+    return excluded
+
+
+def iterAddresses(networks, interfaces=None):
+    excluded = getExclusions()
+    own_addresses = {interface.ip for interface in interfaces or list()}
+    for network in networks:
+        for address in network.hosts():
+            if address in own_addresses or any(address in exclusion for exclusion in excluded):
+                continue
+            yield str(address)
+
+
+def iterLocalAddresses():
+    interfaces = getLocalInterfaces()
+    networks = getLocalNetworks(interfaces)
+    logger.debug("scanning {}".format(", ".join(str(network) for network in networks)))
+    return iterAddresses(networks, interfaces)
+
+
+def iterChunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,135 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('ResolverCache', 'resolver')
+
+
+from ..configuration import config
+from ..logger import root_logger
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, CancelledError
+from collections import OrderedDict
+from threading import Lock
+import socket, time, asyncio
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+def lookupHostname(host):
+    hostname = socket.getfqdn(host)
+    if hostname and hostname != host:
+        return hostname
+    return None
+
+
+class ResolverCache:
+    def __init__(self, ttl: int, negative_ttl: int, max_size: int, timeout: float, workers: int):
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__max_size = max_size
+        self.__timeout = timeout
+        self.__cache = OrderedDict()
+        self.__pending = dict()
+        self.__lock = Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver")
+
+    def __store(self, host, hostname):
+        with self.__lock:
+            self.__cache[host] = (hostname, time.monotonic() + (self.__ttl if hostname else self.__negative_ttl))
+            self.__cache.move_to_end(host)
+            while len(self.__cache) > self.__max_size:
+                self.__cache.popitem(last=False)
+
+    def __done(self, host, future):
+        with self.__lock:
+            self.__pending.pop(host, None)
+        try:
+            hostname = future.result()
+        except CancelledError:
+            return
+        except Exception as ex:
+            logger.debug("lookup for '{}' failed - {}".format(host, ex))
+            hostname = None
+        self.__store(host, hostname)
+
+    def __submit(self, host):
+        with self.__lock:
+            future = self.__pending.get(host)
+            if future:
+                return future
+            future = self.__executor.submit(lookupHostname, host)
+            self.__pending[host] = future
+        future.add_done_callback(lambda f: self.__done(host, f))
+        return future
+
+    def get(self, host):
+        with self.__lock:
+            try:
+                hostname, expires = self.__cache[host]
+            except KeyError:
+                return False, None
+            if expires < time.monotonic():
+                del self.__cache[host]
+                return False, None
+            self.__cache.move_to_end(host)
+            return True, hostname
+
+    def __timedOut(self, host):
+        logger.debug("lookup for '{}' timed out".format(host))
+        self.__store(host, None)
+
+    def resolve(self, host):
+        return self.resolveMany((host,))[host]
+
+    def resolveMany(self, hosts) -> dict:
+        results = dict()
+        futures = dict()
+        for host in hosts:
+            hit, hostname = self.get(host)
+            if hit:
+                results[host] = hostname
+            else:
+                futures[host] = (self.__submit(host), time.monotonic() + self.__timeout)
+        for host, (future, deadline) in futures.items():
+            try:
+                results[host] = future.result(max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                self.__timedOut(host)
+                results[host] = None
+            except Exception:
+                results[host] = None
+        return results
+
+    async def resolveAsync(self, host):
+        hit, hostname = self.get(host)
+        if hit:
+            return hostname
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.__submit(host))), self.__timeout)
+        except asyncio.TimeoutError:
+            self.__timedOut(host)
+        except Exception:
+            pass
+        return None
+
+
+resolver = ResolverCache(
+    ttl=int(config.Discovery.dns_ttl),
+    negative_ttl=int(config.Discovery.dns_negative_ttl),
+    max_size=int(config.Discovery.dns_cache_size),
+    timeout=float(config.Discovery.dns_timeout),
+    workers=int(config.Discovery.dns_workers)
+)
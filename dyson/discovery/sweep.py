@@ -0,0 +1,91 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('sweepHosts', 'verifyHosts')
+
+
+from ..configuration import config
+from ..logger import root_logger
+from .resolver import resolver
+import asyncio, socket
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+async def probeHostAsync(host, port, timeout) -> bool:
+    loop = asyncio.get_running_loop()
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(s, (host, port)), timeout)
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        s.close()
+
+
+async def sweepHostWorker(hosts, ports, valid_hosts, callback, fingerprinter):
+    for host in hosts:
+        if fingerprinter:
+            result = await fingerprinter.identify(host, ports)
+            if result:
+                device_id, port = result
+                valid_hosts[device_id] = (host, port)
+                if callback:
+                    callback(device_id, (host, port))
+            continue
+        results = await asyncio.gather(*(probeHostAsync(host, port, config.Discovery.probe_timeout) for port in ports))
+        open_ports = [port for port, result in zip(ports, results) if result]
+        if open_ports:
+            hostname = await resolver.resolveAsync(host)
+            if hostname:
+                device_id = hostname.upper().split(".", 1)[0]
+                valid_hosts[device_id] = (host, open_ports[0])
+                if callback:
+                    callback(device_id, (host, open_ports[0]))
+
+
+async def sweep(hosts, ports, concurrency, callback, fingerprinter) -> dict:
+    valid_hosts = dict()
+    hosts = iter(hosts)
+    await asyncio.gather(*(sweepHostWorker(hosts, ports, valid_hosts, callback, fingerprinter) for _ in range(concurrency)))
+    return valid_hosts
+
+
+def sweepHosts(hosts, ports, callback=None, fingerprinter=None) -> dict:
+    concurrency = max(1, int(config.Discovery.sweep_concurrency) // max(1, len(ports)))
+    try:
+        return asyncio.run(sweep(hosts, ports, concurrency, callback, fingerprinter))
+    except Exception as ex:
+        logger.error("sweep failed - {}".format(ex))
+        return dict()
+
+
+async def verify(addresses: dict) -> dict:
+    results = await asyncio.gather(
+        *(probeHostAsync(ip, port, config.Discovery.probe_timeout) for ip, port in addresses.values())
+    )
+    return {key: address for (key, address), result in zip(addresses.items(), results) if result}
+
+
+def verifyHosts(addresses: dict) -> dict:
+    try:
+        return asyncio.run(verify(addresses))
+    except Exception as ex:
+        logger.error("verification failed - {}".format(ex))
+        return dict()
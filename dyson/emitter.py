@@ -0,0 +1,46 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('EventEmitter',)
+
+
+from .logger import root_logger
+from .metrics import metrics
+from .codec import dumps
+import cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class EventEmitter:
+    def __init__(self, client: cc_lib.client.Client):
+        self.__client = client
+        self.__events = metrics.counter("emitter.events")
+        self.__failed = metrics.counter("emitter.failed")
+
+    def push(self, device_id: str, service_id: str, data: dict):
+        try:
+            envelope = cc_lib.client.message.EventEnvelope(
+                device=device_id,
+                service=service_id,
+                message=cc_lib.client.message.Message(dumps(data))
+            )
+            self.__client.emmitEvent(envelope, asynchronous=True)
+            self.__events.inc()
+        except Exception as ex:
+            self.__failed.inc()
+            logger.error("could not emit event for '{}' - {}".format(device_id, ex))
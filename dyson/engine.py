@@ -0,0 +1,161 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('SessionEngine', 'engine')
+
+
+from .configuration import config
+from .logger import root_logger
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+import selectors, socket, time
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class EngineLoop(Thread):
+    def __init__(self, num: int, misc_interval: float):
+        super().__init__(name="{}-{}".format(SessionEngine.__name__, num), daemon=True)
+        self.__misc_interval = misc_interval
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__wakeup_w.setblocking(False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ, None)
+        self.__sessions = set()
+        self.__removed = set()
+        self.__registrations = dict()
+        self.__lock = Lock()
+
+    @property
+    def load(self) -> int:
+        with self.__lock:
+            return len(self.__sessions)
+
+    def add(self, session):
+        with self.__lock:
+            self.__sessions.add(session)
+        self.wakeup()
+
+    def remove(self, session):
+        with self.__lock:
+            self.__sessions.discard(session)
+            self.__removed.add(session)
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            self.__wakeup_w.send(b"\x00")
+        except OSError:
+            # buffer full, loop is going to wake up anyway
+            pass
+
+    def __drain(self):
+        try:
+            while self.__wakeup_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def __unregister(self, session):
+        registration = self.__registrations.pop(session, None)
+        if registration:
+            try:
+                self.__selector.unregister(registration[0])
+            except (KeyError, ValueError):
+                pass
+
+    def __sync(self):
+        with self.__lock:
+            sessions = self.__sessions.copy()
+            removed = self.__removed
+            self.__removed = set()
+        for session in removed:
+            self.__unregister(session)
+            session.detached()
+        sockets = dict()
+        # release stale registrations first, closed descriptors may already be reused by other sessions
+        for session in sessions:
+            sock = session.socket()
+            fd = sock.fileno() if sock else -1
+            registration = self.__registrations.get(session)
+            if registration and registration[0] != fd:
+                self.__unregister(session)
+            if fd >= 0:
+                sockets[session] = fd
+        for session, fd in sockets.items():
+            registration = self.__registrations.get(session)
+            events = selectors.EVENT_READ
+            if session.wantWrite():
+                events |= selectors.EVENT_WRITE
+            if not registration:
+                self.__selector.register(fd, events, session)
+                self.__registrations[session] = (fd, events)
+            elif registration[1] != events:
+                self.__selector.modify(fd, events, session)
+                self.__registrations[session] = (fd, events)
+
+    def run(self):
+        last_misc = 0
+        while True:
+            try:
+                self.__sync()
+                timeout = max(0.0, last_misc + self.__misc_interval - time.monotonic())
+                for key, mask in self.__selector.select(timeout):
+                    if key.data is None:
+                        self.__drain()
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        key.data.loopRead()
+                    if mask & selectors.EVENT_WRITE:
+                        key.data.loopWrite()
+                now = time.monotonic()
+                if now - last_misc >= self.__misc_interval:
+                    last_misc = now
+                    with self.__lock:
+                        sessions = self.__sessions.copy()
+                    for session in sessions:
+                        session.loopMisc(now)
+            except Exception as ex:
+                logger.error("engine loop failed - {}".format(ex))
+
+
+class SessionEngine:
+    def __init__(self, threads: int, connect_workers: int, misc_interval: float = 1):
+        self.__loops = [EngineLoop(num, misc_interval) for num in range(max(1, threads))]
+        self.__connector = ThreadPoolExecutor(max_workers=connect_workers, thread_name_prefix="SessionConnector")
+        self.__lock = Lock()
+        self.__started = False
+
+    def attach(self, session) -> EngineLoop:
+        with self.__lock:
+            if not self.__started:
+                for loop in self.__loops:
+                    loop.start()
+                self.__started = True
+        loop = min(self.__loops, key=lambda l: l.load)
+        loop.add(session)
+        return loop
+
+    def connect(self, target):
+        self.__connector.submit(target)
+
+
+engine = SessionEngine(
+    threads=int(config.Session.engine_threads),
+    connect_workers=int(config.Session.connect_workers)
+)
@@ -0,0 +1,94 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('SensorHistory',)
+
+
+from threading import Lock
+import array, bisect, datetime, math, typing
+
+
+def isoTime(timestamp: float) -> str:
+    return "{}Z".format(datetime.datetime.utcfromtimestamp(timestamp).isoformat())
+
+
+class SensorHistory:
+    def __init__(self, fields: typing.Sequence[str], memory: int):
+        self.__fields = tuple(fields)
+        # one double per field plus the timestamp for each sample
+        self.__capacity = max(1, memory // (8 * (len(self.__fields) + 1)))
+        self.__times = array.array("d", bytes(8 * self.__capacity))
+        self.__columns = [array.array("d", bytes(8 * self.__capacity)) for _ in self.__fields]
+        self.__next = 0
+        self.__count = 0
+        self.__lock = Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def __len__(self):
+        return self.__count
+
+    def append(self, timestamp: float, readings: dict):
+        with self.__lock:
+            pos = self.__next
+            self.__times[pos] = timestamp
+            for field, column in zip(self.__fields, self.__columns):
+                value = readings.get(field)
+                column[pos] = math.nan if value is None else value
+            self.__next = (pos + 1) % self.__capacity
+            self.__count = min(self.__count + 1, self.__capacity)
+
+    def __slice(self, start: float) -> typing.Tuple[list, list]:
+        with self.__lock:
+            first = (self.__next - self.__count) % self.__capacity
+            positions = [(first + num) % self.__capacity for num in range(self.__count)]
+            times = [self.__times[pos] for pos in positions]
+            begin = bisect.bisect_left(times, start)
+            positions = positions[begin:]
+            return times[begin:], [[column[pos] for pos in positions] for column in self.__columns]
+
+    def raw(self, start: float) -> list:
+        times, columns = self.__slice(start)
+        samples = list()
+        for num, timestamp in enumerate(times):
+            sample = {"time": isoTime(timestamp)}
+            for field, column in zip(self.__fields, columns):
+                sample[field] = None if math.isnan(column[num]) else column[num]
+            samples.append(sample)
+        return samples
+
+    def downsample(self, start: float, resolution: float) -> list:
+        times, columns = self.__slice(start)
+        windows = list()
+        num = 0
+        while num < len(times):
+            window_start = times[num] - times[num] % resolution
+            end = num
+            while end < len(times) and times[end] < window_start + resolution:
+                end += 1
+            window = {"time": isoTime(window_start), "count": end - num}
+            for field, column in zip(self.__fields, columns):
+                values = [value for value in column[num:end] if not math.isnan(value)]
+                window[field] = {
+                    "min": min(values),
+                    "max": max(values),
+                    "avg": round(sum(values) / len(values), 3)
+                } if values else None
+            windows.append(window)
+            num = end
+        return windows
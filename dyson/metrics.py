@@ -0,0 +1,153 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Counter', 'Summary', 'Histogram', 'Registry', 'metrics', 'logMetrics')
+
+
+from .configuration import config
+from .logger import root_logger
+from threading import Lock
+import bisect, json, typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+class Counter:
+    def __init__(self):
+        self.__lock = Lock()
+        self.__value = 0
+
+    def inc(self, value=1):
+        with self.__lock:
+            self.__value += value
+
+    @property
+    def value(self):
+        return self.__value
+
+    def snapshot(self):
+        return self.__value
+
+
+class Summary:
+    def __init__(self):
+        self.__lock = Lock()
+        self.__count = 0
+        self.__sum = 0.0
+        self.__max = 0.0
+        self.__last = 0.0
+
+    def observe(self, value: float):
+        with self.__lock:
+            self.__count += 1
+            self.__sum += value
+            self.__last = value
+            if value > self.__max:
+                self.__max = value
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                "count": self.__count,
+                "avg": self.__sum / self.__count if self.__count else 0.0,
+                "max": self.__max,
+                "last": self.__last
+            }
+
+
+def parseBuckets(value) -> tuple:
+    return tuple(sorted(float(item) for item in str(value).split(";") if item.strip()))
+
+
+default_buckets = parseBuckets(config.Logger.latency_buckets)
+
+
+class Histogram:
+    def __init__(self, buckets: typing.Sequence[float] = None):
+        self.__lock = Lock()
+        self.__buckets = tuple(sorted(buckets or default_buckets))
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__count = 0
+        self.__sum = 0.0
+        self.__max = 0.0
+
+    def observe(self, value: float):
+        with self.__lock:
+            self.__counts[bisect.bisect_left(self.__buckets, value)] += 1
+            self.__count += 1
+            self.__sum += value
+            if value > self.__max:
+                self.__max = value
+
+    def __quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the quantile, max for the overflow bucket
+        rank = q * self.__count
+        total = 0
+        for bound, count in zip(self.__buckets, self.__counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.__max
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                "count": self.__count,
+                "avg": self.__sum / self.__count if self.__count else 0.0,
+                "max": self.__max,
+                "p50": self.__quantile(0.5) if self.__count else 0.0,
+                "p95": self.__quantile(0.95) if self.__count else 0.0,
+                "p99": self.__quantile(0.99) if self.__count else 0.0,
+                "buckets": dict(zip([str(bound) for bound in self.__buckets] + ["inf"], self.__counts))
+            }
+
+
+class Registry:
+    def __init__(self):
+        self.__lock = Lock()
+        self.__metrics = dict()
+
+    def __get(self, name, metric_type, *args):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = metric_type(*args)
+                self.__metrics[name] = metric
+            elif not isinstance(metric, metric_type):
+                raise TypeError("metric '{}' is a {}".format(name, type(metric).__name__))
+            return metric
+
+    def counter(self, name: str) -> Counter:
+        return self.__get(name, Counter)
+
+    def summary(self, name: str) -> Summary:
+        return self.__get(name, Summary)
+
+    def histogram(self, name: str, buckets: typing.Sequence[float] = None) -> Histogram:
+        return self.__get(name, Histogram, buckets)
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            metrics = self.__metrics.copy()
+        return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+
+metrics = Registry()
+
+
+def logMetrics():
+    logger.info(json.dumps(metrics.snapshot()))
@@ -14,45 +14,221 @@
    limitations under the License.
 """
 
-__all__ = ('commandRouter',)
+__all__ = ('commandRouter', 'CommandDispatcher')
 
 from .configuration import config
 from .logger import root_logger
-import time, json, cc_lib
+from .metrics import metrics
+from .codec import loads, dumps
+from .spool import Spool
+from threading import Thread, Condition
+from concurrent.futures import Future
+import time, heapq, itertools, cc_lib
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
-def commandRouter(connector_client: cc_lib.client.Client, device_manager):
-    while True:
-        command = connector_client.receiveCommand()
+def sendResult(connector_client: cc_lib.client.Client, command, data):
+    try:
+        command.message = cc_lib.client.message.Message(data if isinstance(data, str) else dumps(data))
+    except TypeError as ex:
+        logger.error("could not parse command response data for '{}' - {}".format(command.device_id, ex))
+        command.message = cc_lib.client.message.Message(dumps({"status": 1}))
+    if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
+        logger.debug(command)
+        connector_client.sendResponse(command, asynchronous=True)
+
+
+def executeCommand(connector_client: cc_lib.client.Client, device_manager, command) -> Future:
+    # state changes complete asynchronously, the response is sent once the returned future is done
+    result = Future()
+    try:
+        device = device_manager.get(command.device_id)
+        logger.debug(command)
+        if time.time() - command.timestamp <= config.Session.max_command_age:
+            try:
+                if command.message.data:
+                    data = device.getService(command.service_uri).task(device, **loads(command.message.data))
+                else:
+                    data = device.getService(command.service_uri).task(device)
+            except (ValueError, TypeError) as ex:
+                logger.error("could not parse command data for '{}' - {}".format(device.id, ex))
+                data = {"status": 1}
+            if isinstance(data, Future):
+                data.add_done_callback(lambda future: sendResult(connector_client, command, future.result()))
+                data.add_done_callback(lambda future: result.set_result(None))
+                return result
+            sendResult(connector_client, command, data)
+        else:
+            logger.warning(
+                "dropped command for '{}' - max age exceeded - correlation id: {}".format(
+                    device.id,
+                    command.correlation_id
+                )
+            )
+    except KeyError:
+        logger.error("received command for unknown device '{}'".format(command.device_id))
+    result.set_result(None)
+    return result
+
+
+class CommandDispatcher:
+    def __init__(self, connector_client: cc_lib.client.Client, device_manager, workers: int, max_pending: int, max_device_pending: int, read_share: int):
+        self.__client = connector_client
+        self.__device_manager = device_manager
+        self.__max_pending = max_pending
+        self.__max_device_pending = max_device_pending
+        self.__read_share = max(1, read_share)
+        self.__queues = dict()
+        self.__ready = list()
+        self.__reads = list()
+        self.__device_reads = dict()
+        self.__read_streak = 0
+        self.__seq = itertools.count()
+        self.__pending = 0
+        self.__condition = Condition()
+        self.__queue_depth = metrics.summary("router.queue_depth")
+        self.__wait_time = metrics.summary("router.wait_time")
+        self.__rejected = metrics.counter("router.rejected")
+        self.__dropped = metrics.counter("router.dropped")
+        self.__late = metrics.counter("router.late")
+        self.__workers = [
+            Thread(target=self.__work, name="{}-{}".format(__class__.__name__, num), daemon=True) for num in range(max(1, workers))
+        ]
+        for worker in self.__workers:
+            worker.start()
+
+    @property
+    def pending(self) -> int:
+        with self.__condition:
+            return self.__pending
+
+    def __isRead(self, command) -> bool:
         try:
-            device = device_manager.get(command.device_id)
-            logger.debug(command)
-            if time.time() - command.timestamp <= config.Session.max_command_age:
-                try:
-                    if command.message.data:
-                        data = device.getService(command.service_uri).task(device, **json.loads(command.message.data))
-                    else:
-                        data = device.getService(command.service_uri).task(device)
-                    cmd_resp = cc_lib.client.message.Message(json.dumps(data))
-                except json.JSONDecodeError as ex:
-                    logger.error("could not parse command data for '{}' - {}".format(device.id, ex))
-                    cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
-                except TypeError as ex:
-                    logger.error("could not parse command response data for '{}' - {}".format(device.id, ex))
-                    cmd_resp = cc_lib.client.message.Message(json.dumps({"status": 1}))
-                command.message = cmd_resp
-                if command.completion_strategy == cc_lib.client.CompletionStrategy.pessimistic:
-                    logger.debug(command)
-                    connector_client.sendResponse(command, asynchronous=True)
+            device = self.__device_manager.get(command.device_id)
+            return getattr(device.getService(command.service_uri), "read_only", False)
+        except Exception:
+            return False
+
+    def __drop(self, command):
+        self.__dropped.inc()
+        logger.warning(
+            "dropped command for '{}' - max age exceeded - correlation id: {}".format(
+                command.device_id,
+                command.correlation_id
+            )
+        )
+
+    def __reject(self, command):
+        self.__rejected.inc()
+        logger.warning(
+            "dropped command for '{}' - too many pending commands - correlation id: {}".format(
+                command.device_id,
+                command.correlation_id
+            )
+        )
+
+    def submit(self, command):
+        deadline = command.timestamp + config.Session.max_command_age
+        if time.time() > deadline:
+            self.__drop(command)
+            return
+        read = self.__isRead(command)
+        with self.__condition:
+            while self.__pending >= self.__max_pending:
+                # back-pressure, stop receiving until workers catch up
+                self.__condition.wait()
+            item = (deadline, next(self.__seq), command, time.monotonic())
+            if read:
+                # reads don't wait behind writes queued for the same device
+                device_reads = self.__device_reads.get(command.device_id, 0)
+                if device_reads >= self.__max_device_pending:
+                    self.__reject(command)
+                    return
+                self.__device_reads[command.device_id] = device_reads + 1
+                heapq.heappush(self.__reads, item)
             else:
-                logger.warning(
-                    "dropped command for '{}' - max age exceeded - correlation id: {}".format(
-                        device.id,
-                        command.correlation_id
-                    )
+                queue = self.__queues.get(command.device_id)
+                if queue is None:
+                    queue = list()
+                    self.__queues[command.device_id] = queue
+                    heapq.heappush(self.__ready, (deadline, next(self.__seq), command.device_id))
+                elif len(queue) >= self.__max_device_pending:
+                    self.__reject(command)
+                    return
+                heapq.heappush(queue, item)
+            self.__pending += 1
+            self.__queue_depth.observe(self.__pending)
+            self.__condition.notify_all()
+
+    def __next(self):
+        while True:
+            with self.__condition:
+                while not (self.__reads or self.__ready):
+                    self.__condition.wait()
+                # a write is served after read_share reads in a row, so a stream of reads can't starve writes
+                read = bool(self.__reads) and (not self.__ready or self.__read_streak < self.__read_share)
+                if read:
+                    self.__read_streak += 1
+                    deadline, _, command, enqueued = heapq.heappop(self.__reads)
+                    device_id = command.device_id
+                else:
+                    self.__read_streak = 0
+                    _, _, device_id = heapq.heappop(self.__ready)
+                    deadline, _, command, enqueued = heapq.heappop(self.__queues[device_id])
+            self.__wait_time.observe(time.monotonic() - enqueued)
+            if time.time() > deadline:
+                self.__drop(command)
+                self.__done(device_id, read)
+                continue
+            return device_id, command, deadline, enqueued, read
+
+    def __done(self, device_id, read):
+        with self.__condition:
+            self.__pending -= 1
+            if read:
+                device_reads = self.__device_reads.pop(device_id) - 1
+                if device_reads:
+                    self.__device_reads[device_id] = device_reads
+            else:
+                queue = self.__queues[device_id]
+                if queue:
+                    heapq.heappush(self.__ready, (queue[0][0], next(self.__seq), device_id))
+                else:
+                    # a device is only in ready or in flight once, this keeps its commands in order
+                    del self.__queues[device_id]
+            self.__condition.notify_all()
+
+    def __observe(self, command, deadline, enqueued):
+        latency = time.monotonic() - enqueued
+        metrics.histogram("router.latency.device.{}".format(command.device_id)).observe(latency)
+        metrics.histogram("router.latency.service.{}".format(command.service_uri)).observe(latency)
+        if time.time() > deadline:
+            self.__late.inc()
+
+    def __work(self):
+        while True:
+            device_id, command, deadline, enqueued, read = self.__next()
+            try:
+                # the device is free again as soon as the command is handed over, so writes can join a pending state change
+                executeCommand(self.__client, self.__device_manager, command).add_done_callback(
+                    lambda future, command=command, deadline=deadline, enqueued=enqueued: self.__observe(command, deadline, enqueued)
                 )
-        except KeyError:
-            logger.error("received command for unknown device '{}'".format(command.device_id))
+            except Exception as ex:
+                logger.error("executing command for '{}' failed - {}".format(command.device_id, ex))
+            finally:
+                self.__done(device_id, read)
+
+
+def commandRouter(connector_client: cc_lib.client.Client, device_manager, spool: Spool = None):
+    dispatcher = CommandDispatcher(
+        spool or connector_client,
+        device_manager,
+        workers=int(config.Router.workers),
+        max_pending=int(config.Router.max_pending),
+        max_device_pending=int(config.Router.max_device_pending),
+        read_share=int(config.Router.read_share)
+    )
+    while True:
+        dispatcher.submit(connector_client.receiveCommand())
@@ -0,0 +1,113 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Job', 'Scheduler', 'scheduler', 'phase')
+
+
+from .logger import root_logger
+from .metrics import metrics
+from threading import Thread, Condition
+import heapq, itertools, random, time, zlib, typing
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+def phase(key: str, interval: float) -> float:
+    # stable per key offset, spreads devices connecting at the same time over the interval
+    return zlib.crc32(key.encode()) % 1000 / 1000 * interval
+
+
+class Job:
+    def __init__(self, scheduler: "Scheduler", target: typing.Callable, interval: float, jitter: float, name: str):
+        self.target = target
+        self.interval = interval
+        self.jitter = jitter
+        self.name = name
+        self.due = 0.0
+        self.cancelled = False
+        self.__scheduler = scheduler
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reschedule(self, delay: float, interval: float = None):
+        if interval is not None:
+            self.interval = interval
+        self.__scheduler.push(self, time.monotonic() + delay)
+
+
+class Scheduler(Thread):
+    def __init__(self):
+        super().__init__(name=__class__.__name__, daemon=True)
+        self.__queue = list()
+        self.__seq = itertools.count()
+        self.__condition = Condition()
+        self.__lag = metrics.summary("scheduler.lag")
+        self.__started = False
+
+    def push(self, job: Job, due: float):
+        with self.__condition:
+            if not self.__started:
+                self.__started = True
+                self.start()
+            job.due = due
+            heapq.heappush(self.__queue, (due, next(self.__seq), job))
+            self.__condition.notify()
+
+    def schedule(self, target: typing.Callable, interval: float, delay: float = None, jitter: float = 0.0, name: str = None) -> Job:
+        job = Job(self, target, interval, jitter, name or getattr(target, "__name__", "job"))
+        self.push(job, time.monotonic() + (random.uniform(0, interval) if delay is None else delay))
+        return job
+
+    def callLater(self, delay: float, target: typing.Callable, name: str = None) -> Job:
+        return self.schedule(target, 0, delay=delay, name=name)
+
+    def __next(self) -> Job:
+        with self.__condition:
+            while True:
+                while not self.__queue:
+                    self.__condition.wait()
+                due, _, job = self.__queue[0]
+                if job.cancelled or due != job.due:
+                    # cancelled or superseded by a reschedule
+                    heapq.heappop(self.__queue)
+                    continue
+                timeout = due - time.monotonic()
+                if timeout <= 0:
+                    heapq.heappop(self.__queue)
+                    return job
+                self.__condition.wait(timeout)
+
+    def run(self):
+        while True:
+            job = self.__next()
+            now = time.monotonic()
+            self.__lag.observe(now - job.due)
+            due = job.due
+            try:
+                job.target()
+            except Exception as ex:
+                logger.error("job '{}' failed - {}".format(job.name, ex))
+            if job.interval > 0 and not job.cancelled and job.due == due:
+                next_due = due + job.interval * (1 + random.uniform(-job.jitter, job.jitter))
+                if next_due < now:
+                    # skip missed runs instead of firing them in a burst
+                    next_due = now + job.interval
+                self.push(job, next_due)
+
+
+scheduler = Scheduler()
@@ -17,19 +17,50 @@
 
 from .configuration import config
 from .logger import root_logger
-from .util import LockingDict, decrypt_password
+from .util import StateSnapshot, decrypt_password
+from .engine import engine
+from .scheduler import scheduler, phase
+from .metrics import metrics
+from .codec import loads, dumps
+from .emitter import EventEmitter
+from .deadband import Deadband, parseThresholds
+from .history import SensorHistory
+from .types.schema import schemas
+from concurrent.futures import Future
 import paho.mqtt.client as mqtt
-import time, json, threading, cc_lib
+import time, threading, functools, typing, datetime, cc_lib
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
-class Session(threading.Thread):
-    def __init__(self, client: cc_lib.client.Client, model_num: str, device_id: str, pw: str, ip:str , port: int):
-        super().__init__(name="Session-{}".format(device_id), daemon=True)
+def parseIntervals(value) -> dict:
+    # "<serial>=<min>:<max>;..."
+    intervals = dict()
+    for item in str(value or "").split(";"):
+        if not item.strip():
+            continue
+        try:
+            device_id, limits = item.split("=", 1)
+            min_interval, max_interval = limits.split(":", 1)
+            intervals[device_id.strip()] = (float(min_interval), float(max_interval))
+        except ValueError:
+            logger.error("invalid sensor interval '{}'".format(item))
+    return intervals
+
+
+sensor_intervals = parseIntervals(config.Session.sensor_intervals)
+deadband_absolute = parseThresholds(config.Session.deadband_absolute)
+deadband_relative = parseThresholds(config.Session.deadband_relative)
+
+
+class Session:
+    def __init__(self, client: cc_lib.client.Client, model_num: str, device_id: str, pw: str, ip:str , port: int, emitter: EventEmitter = None):
+        self.name = "Session-{}".format(device_id)
         self.__client = client
+        self.__emitter = emitter
         self.__model_num = model_num
+        self.__schema = schemas[model_num]
         self.__device_id = device_id
         self.__ip = ip
         self.__port = port
@@ -42,52 +73,169 @@ class Session(threading.Thread):
             self.__mqtt_client.enable_logger(logger.getChild(self.__device_id))
         self.__discon_count = 0
         self.__stop = False
-        self.__sensor_trigger = threading.Thread(target=self.__trigger_sensor_data, name="-Sensor-Trigger".format(self.name), daemon=True)
-        self.__device_state = LockingDict()
+        self.__loop = None
+        self.__connecting = False
+        self.__retry_at = 0
+        self.__jobs = list()
+        self.__sensor_job = None
+        self.__pending_state = dict()
+        self.__pending_futures = list()
+        self.__pending_lock = threading.Lock()
+        self.__flush_job = None
+        self.__confirmations = list()
+        self.__confirm_latency = metrics.histogram("session.confirm_latency.{}".format(device_id))
+        self.__unconfirmed = metrics.counter("session.unconfirmed")
+        self.__min_interval, self.__max_interval = sensor_intervals.get(
+            device_id,
+            (config.Session.sensor_interval_min, config.Session.sensor_interval_max)
+        )
+        self.__sensor_interval = min(max(config.Session.sensor_interval, self.__min_interval), self.__max_interval)
+        self.__last_readings = None
+        self.__deadband = Deadband(deadband_absolute, deadband_relative, config.Session.deadband_heartbeat) if config.Session.deadband else None
+        self.__suppressed = metrics.counter("session.suppressed_readings")
+        self.__history = SensorHistory(self.__schema.sensor_fields, int(config.Session.history_memory)) if config.Session.history_memory > 0 else None
+        self.__last_message = 0
+        self.__last_refresh = 0
+        self.__closed = threading.Event()
+        self.__handlers = {
+            "CURRENT-STATE": self.__handleCurrentState,
+            "STATE-CHANGE": self.__handleStateChange,
+            "ENVIRONMENTAL-CURRENT-SENSOR-DATA": self.__handleSensorData
+        }
+        self.__device_state = StateSnapshot()
         self.__push_sensor_data_service = None
+        self.__device_state_service = None
+        self.__state_payload = None
 
     def setSensorDataService(self, service):
         self.__push_sensor_data_service = service
 
+    def setDeviceStateService(self, service):
+        self.__device_state_service = service
+
     def stop(self):
         if not self.__stop:
             self.__stop = True
+            self.__cancelJobs()
+            self.__cancelFlush()
             self.__mqtt_client.disconnect()
-            self.join()
+            if self.__loop:
+                self.__loop.remove(self)
+                self.__closed.wait(5)
 
-    def __cleanState(self, state):
-        odd_keys = ['filf', 'fnst', 'ercd', 'wacd']
-        missing_keys = {'sltm': 'STET', 'rstf': 'STET'}
-        for key in odd_keys:
-            try:
-                del state[key]
-            except KeyError:
-                pass
-        for key, value in missing_keys.items():
-            state[key] = value
+    def getState(self) -> StateSnapshot:
+        return self.__device_state
+
+    def getStatePayload(self) -> typing.Optional[str]:
+        return self.__state_payload
 
-    def getState(self):
-        return self.__device_state.copy()
+    def getHistory(self) -> typing.Optional[SensorHistory]:
+        return self.__history
 
-    def setState(self, state):
+    def setState(self, state) -> Future:
+        future = Future()
         if not self.__mqtt_client.is_connected():
-            return "not connected to '{}'".format(self.__device_id)
+            future.set_result("not connected to '{}'".format(self.__device_id))
+            return future
         if not self.__device_state:
-            return "device '{}' not ready".format(self.__device_id)
+            future.set_result("device '{}' not ready".format(self.__device_id))
+            return future
+        if config.Session.command_window <= 0:
+            self.__publishState(state, [future])
+            return future
+        with self.__pending_lock:
+            self.__pending_state.update(state)
+            self.__pending_futures.append(future)
+            if not self.__flush_job:
+                self.__flush_job = scheduler.callLater(config.Session.command_window, self.__flushState, name="{}-flush_state".format(self.__device_id))
+        return future
+
+    def __flushState(self):
+        # one STATE-SET for all commands received within the window
+        with self.__pending_lock:
+            state = self.__pending_state
+            futures = self.__pending_futures
+            self.__pending_state = dict()
+            self.__pending_futures = list()
+            self.__flush_job = None
+        if len(futures) > 1:
+            logger.debug("coalesced {} commands for '{}'".format(len(futures), self.__device_id))
+        self.__publishState(state, futures)
+
+    def __cancelFlush(self):
+        with self.__pending_lock:
+            futures = self.__pending_futures
+            self.__pending_state = dict()
+            self.__pending_futures = list()
+            if self.__flush_job:
+                self.__flush_job.cancel()
+                self.__flush_job = None
+        self.__resolve(futures, "session for '{}' stopped".format(self.__device_id))
+
+    def __resolve(self, futures, err):
+        for future in futures:
+            future.set_result(err)
+
+    def __publishState(self, state, futures):
+        if not self.__mqtt_client.is_connected():
+            self.__resolve(futures, "not connected to '{}'".format(self.__device_id))
+            return
         try:
-            device_state = self.__device_state.copy()
-            device_state.update(state)
-            self.__cleanState(device_state)
+            if config.Session.full_state_set:
+                data = self.__schema.fullState(self.__device_state, state)
+            else:
+                current_state = self.__device_state
+                data = {key: value for key, value in state.items() if current_state.get(key) != value}
+                if not data:
+                    self.__resolve(futures, False)
+                    return
             payload = {
                 "msg": "STATE-SET",
                 "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                 "mode-reason": "LAPP",
-                "data": device_state
+                "data": data
             }
-            self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), json.dumps(payload), 1)
+            published = time.monotonic()
+            info = self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), dumps(payload), 1)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                raise RuntimeError(mqtt.error_string(info.rc))
         except Exception as ex:
-            return "error setting state for '{}' - {}".format(self.__device_id, ex)
-        return False
+            self.__resolve(futures, "error setting state for '{}' - {}".format(self.__device_id, ex))
+            return
+        if not config.Session.confirm_commands:
+            self.__resolve(futures, False)
+            return
+        # registered after publishing, a failed publish must not be resolved again
+        confirmation = (state, futures, published)
+        with self.__pending_lock:
+            self.__confirmations.append(confirmation)
+        scheduler.callLater(
+            config.Session.confirm_timeout,
+            functools.partial(self.__expireConfirmation, confirmation),
+            name="{}-confirm_state".format(self.__device_id)
+        )
+        # the device may have reported the new state before the confirmation was registered
+        self.__confirmState()
+
+    def __confirmState(self):
+        # a command is confirmed once the device reports all requested values
+        state = self.__device_state
+        with self.__pending_lock:
+            confirmed = [item for item in self.__confirmations if all(state.get(key) == value for key, value in item[0].items())]
+            for item in confirmed:
+                self.__confirmations.remove(item)
+        now = time.monotonic()
+        for _, futures, published in confirmed:
+            self.__confirm_latency.observe(now - published)
+            self.__resolve(futures, False)
+
+    def __expireConfirmation(self, confirmation):
+        with self.__pending_lock:
+            if confirmation not in self.__confirmations:
+                return
+            self.__confirmations.remove(confirmation)
+        self.__unconfirmed.inc()
+        self.__resolve(confirmation[1], "'{}' did not confirm new state".format(self.__device_id))
 
     def connect_device_to_platform(self):
         if self.__mqtt_client.is_connected():
@@ -96,48 +244,120 @@ class Session(threading.Thread):
             except (cc_lib.client.DeviceConnectError, cc_lib.client.NotConnectedError):
                 pass
 
-    def run(self):
+    def start(self):
         logger.info("starting session for '{}' ...".format(self.__device_id))
-        while True:
-            try:
-                self.__mqtt_client.connect(self.__ip, self.__port, keepalive=config.Session.keepalive)
-                if not self.__sensor_trigger.is_alive():
-                    self.__sensor_trigger.start()
-            except Exception as ex:
-                logger.error("could not connect to '{}' at '{}' on '{}' - {}".format(self.__device_id, self.__ip, self.__port, ex))
-            try:
-                self.__mqtt_client.loop_forever()
-            except Exception as ex:
-                logger.error("mqtt loop broke - {}".format(ex))
+        self.__connecting = True
+        self.__loop = engine.attach(self)
+        engine.connect(self.__connect)
+
+    def detached(self):
+        self.__closed.set()
+        logger.info("session for '{}' closed".format(self.__device_id))
+
+    def __connect(self):
+        try:
+            self.__mqtt_client.connect(self.__ip, self.__port, keepalive=config.Session.keepalive)
             if self.__stop:
-                break
+                self.__mqtt_client.disconnect()
+        except Exception as ex:
+            logger.error("could not connect to '{}' at '{}' on '{}' - {}".format(self.__device_id, self.__ip, self.__port, ex))
+            self.__retry_at = time.monotonic() + 2
+        self.__connecting = False
+        self.__loop.wakeup()
+
+    def socket(self):
+        if self.__connecting:
+            return None
+        return self.__mqtt_client.socket()
+
+    def wantWrite(self) -> bool:
+        return self.__mqtt_client.want_write()
+
+    def loopRead(self):
+        try:
+            self.__mqtt_client.loop_read()
+        except Exception as ex:
+            logger.error("mqtt read for '{}' failed - {}".format(self.__device_id, ex))
+
+    def loopWrite(self):
+        try:
+            self.__mqtt_client.loop_write()
+        except Exception as ex:
+            logger.error("mqtt write for '{}' failed - {}".format(self.__device_id, ex))
+
+    def loopMisc(self, now):
+        if self.__stop or self.__connecting:
+            return
+        if self.__mqtt_client.socket() is None:
+            if now >= self.__retry_at:
+                self.__connecting = True
+                engine.connect(self.__connect)
+            return
+        try:
+            self.__mqtt_client.loop_misc()
+        except Exception as ex:
+            logger.error("mqtt loop for '{}' failed - {}".format(self.__device_id, ex))
+
+    def __scheduleJobs(self):
+        self.__cancelJobs()
+        self.__last_message = self.__last_refresh = time.monotonic()
+        sensor_interval = self.__sensor_interval if config.Session.adaptive_polling else config.Session.sensor_interval
+        for target, interval in ((self.__trigger_sensor_data, sensor_interval), (self.__refresh_state, config.Session.state_interval)):
+            self.__jobs.append(
+                scheduler.schedule(
+                    target,
+                    interval,
+                    delay=phase(self.__device_id, interval),
+                    jitter=config.Session.jitter,
+                    name="{}-{}".format(self.__device_id, target.__name__.rsplit("__", 1)[-1])
+                )
+            )
+        self.__sensor_job = self.__jobs[0]
+
+    def __cancelJobs(self):
+        for job in self.__jobs:
+            job.cancel()
+        self.__jobs.clear()
+        self.__sensor_job = None
+
+    def __adaptPolling(self, data):
+        # back off while readings are stable, tighten while they move, readings pushed by the device replace the next poll
+        job = self.__sensor_job
+        if not job:
+            return
+        readings = {key: value for key, value in data.items() if key != "sltm"}
+        if self.__last_readings is not None:
+            if readings == self.__last_readings:
+                self.__sensor_interval = min(self.__sensor_interval * config.Session.sensor_backoff, self.__max_interval)
             else:
-                time.sleep(2)
-        self.__sensor_trigger.join()
-        logger.info("session for '{}' closed".format(self.__device_id))
+                self.__sensor_interval = max(self.__sensor_interval / config.Session.sensor_backoff, self.__min_interval)
+        self.__last_readings = readings
+        job.reschedule(self.__sensor_interval, self.__sensor_interval)
 
     def __trigger_device_state(self):
         payload = {
             "msg": "REQUEST-CURRENT-STATE",
             "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
         }
-        self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), json.dumps(payload), 1)
+        self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), dumps(payload), 1)
+
+    def __refresh_state(self):
+        if self.__last_message < self.__last_refresh:
+            # no answer to the previous refresh
+            logger.warning("'{}' not responding - reconnecting".format(self.__device_id))
+            self.__mqtt_client.disconnect()
+            return
+        self.__last_refresh = time.monotonic()
+        self.__trigger_device_state()
 
     def __trigger_sensor_data(self):
-        logger.debug("starting sensor trigger for '{}' ...".format(self.__device_id))
-        while True:
-            if self.__mqtt_client.is_connected() and self.__device_state.get("rhtm") == "ON":
-                logger.debug("triggering sensor data for '{}'".format(self.__device_id))
-                payload = {
-                    "msg": "REQUEST-PRODUCT-ENVIRONMENT-CURRENT-SENSOR-DATA",
-                    "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-                }
-                self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), json.dumps(payload))
-            if not self.__stop:
-                time.sleep(config.Session.sensor_interval)
-            else:
-                break
-        logger.debug("sensor trigger for '{}' stopped".format(self.__device_id))
+        if self.__mqtt_client.is_connected() and self.__device_state.get("rhtm") == "ON":
+            logger.debug("triggering sensor data for '{}'".format(self.__device_id))
+            payload = {
+                "msg": "REQUEST-PRODUCT-ENVIRONMENT-CURRENT-SENSOR-DATA",
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            }
+            self.__mqtt_client.publish('{}/{}/command'.format(self.__model_num, self.__device_id), dumps(payload))
 
     def __pushSensorData(self, data, timestamp):
         try:
@@ -145,28 +365,57 @@ class Session(threading.Thread):
         except KeyError:
             pass
         if all(val not in ("OFF", "INIT") for val in data.values()):
+            readings = self.__push_sensor_data_service.task(data, timestamp, self.__model_num)
+            if self.__history is not None:
+                self.__history.append(time.time(), readings)
+            if self.__deadband and not self.__deadband.check(readings, time.monotonic()):
+                self.__suppressed.inc()
+                return
+            if self.__emitter:
+                self.__emitter.push(self.__device_id, self.__push_sensor_data_service.local_id, readings)
+                return
             envelope = cc_lib.client.message.EventEnvelope(
                 device=self.__device_id,
                 service=self.__push_sensor_data_service.local_id,
-                message=cc_lib.client.message.Message(json.dumps(self.__push_sensor_data_service.task(data, timestamp)))
+                message=cc_lib.client.message.Message(dumps(readings))
             )
             self.__client.emmitEvent(envelope, asynchronous=True)
         else:
             logger.debug("sensors of '{}' not ready".format(self.__device_id))
 
+    def __updateState(self, changes):
+        state = self.__device_state.update(changes)
+        if state is not self.__device_state:
+            if self.__device_state_service:
+                # served as is by the device state service
+                timestamp = "{}Z".format(datetime.datetime.utcnow().isoformat())
+                self.__state_payload = dumps(self.__device_state_service.payload(state, timestamp, self.__model_num))
+            self.__device_state = state
+
+    def __handleCurrentState(self, payload):
+        if not self.__device_state:
+            logger.debug("got initial state for '{}'".format(self.__device_id))
+        self.__updateState(payload["product-state"])
+
+    def __handleStateChange(self, payload):
+        self.__updateState({key :value[1] for key, value in payload["product-state"].items()})
+        logger.debug("got new state for '{}'".format(self.__device_id))
+        if self.__confirmations:
+            self.__confirmState()
+
+    def __handleSensorData(self, payload):
+        if config.Session.adaptive_polling:
+            self.__adaptPolling(payload["data"])
+        if self.__device_state.get("rhtm") == "ON":
+            self.__pushSensorData(payload["data"], payload["time"])
+
     def __on_message(self, client, userdata, message: mqtt.MQTTMessage):
+        self.__last_message = time.monotonic()
         try:
-            payload = json.loads(message.payload)
-            if payload["msg"] == "CURRENT-STATE":
-                if not self.__device_state:
-                    self.__device_state.update(payload["product-state"])
-                    logger.debug("got initial state for '{}'".format(self.__device_id))
-            elif payload["msg"] == "STATE-CHANGE":
-                self.__device_state.update({key :value[1] for key, value in payload["product-state"].items()})
-                logger.debug("got new state for '{}'".format(self.__device_id))
-            elif payload["msg"] == "ENVIRONMENTAL-CURRENT-SENSOR-DATA":
-                if self.__device_state.get("rhtm") == "ON":
-                    self.__pushSensorData(payload["data"], payload["time"])
+            payload = loads(message.payload)
+            handler = self.__handlers.get(payload["msg"])
+            if handler:
+                handler(payload)
             else:
                 logger.warning("received unknown message type from '{}' - '{}'".format(self.__device_id, payload["msg"]))
         except Exception as ex:
@@ -177,12 +426,17 @@ class Session(threading.Thread):
             self.__discon_count = 0
             logger.info("connected to '{}'".format(self.__device_id))
             self.__mqtt_client.subscribe("{}/{}/status/current".format(self.__model_num, self.__device_id))
+            if self.__deadband:
+                self.__deadband.reset()
             self.__trigger_device_state()
+            self.__scheduleJobs()
             self.connect_device_to_platform()
         else:
             logger.error("could not connect to '{}' - {}".format(self.__device_id, mqtt.connack_string(rc)))
 
     def __on_disconnect(self, client, userdata, rc):
+        self.__retry_at = time.monotonic() + 2
+        self.__cancelJobs()
         if self.__discon_count < 1:
             if rc == 0:
                 logger.info("disconnected from '{}'".format(self.__device_id))
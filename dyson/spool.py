@@ -0,0 +1,220 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('Spool',)
+
+
+from .configuration import config, user_dir
+from .logger import root_logger
+from .metrics import metrics
+from threading import Thread, Condition
+import os, time, collections, sqlite3, cc_lib
+
+
+logger = root_logger.getChild(__name__.split(".", 1)[-1])
+
+
+EVENT = "event"
+RESPONSE = "response"
+
+
+class Spool(Thread):
+    def __init__(self, client: cc_lib.client.Client, max_items: int, replay_rate: float, file_name: str = "spool.db"):
+        super().__init__(name=__class__.__name__, daemon=True)
+        self.__client = client
+        self.__max_items = max(1, max_items)
+        self.__replay_rate = max(1.0, replay_rate)
+        self.__condition = Condition()
+        self.__connected = False
+        # messages sent while connected, the spool thread confirms their delivery
+        self.__live = collections.deque()
+        # responses are only useful for max_command_age, so they are kept in memory
+        self.__responses = collections.deque()
+        self.__db = sqlite3.connect(os.path.join(user_dir, file_name), check_same_thread=False, isolation_level=None)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT NOT NULL, service_uri TEXT NOT NULL, data TEXT NOT NULL)")
+        self.__pending = self.__db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        if self.__pending:
+            logger.info("{} spooled events from previous run".format(self.__pending))
+        self.__spooled = metrics.counter("spool.spooled")
+        self.__replayed = metrics.counter("spool.replayed")
+        self.__dropped = metrics.counter("spool.dropped")
+        self.__depth = metrics.summary("spool.depth")
+
+    def setConnected(self, connected: bool):
+        with self.__condition:
+            self.__connected = connected
+            self.__condition.notify_all()
+
+    def __isConnected(self) -> bool:
+        with self.__condition:
+            return self.__connected
+
+    def emmitEvent(self, envelope, asynchronous: bool = True):
+        self.__push(EVENT, envelope)
+
+    def sendResponse(self, envelope, asynchronous: bool = True):
+        self.__push(RESPONSE, envelope)
+
+    def __push(self, kind, envelope):
+        with self.__condition:
+            connected = self.__connected
+            if connected:
+                # live messages don't wait for the backlog, readings carry the time they were taken
+                if len(self.__live) >= self.__max_items:
+                    self.__live.popleft()
+                    self.__dropped.inc()
+                self.__live.append((kind, envelope))
+                self.__condition.notify_all()
+        if not connected:
+            self.__spool(kind, envelope)
+
+    def __spool(self, kind, envelope):
+        if kind == EVENT:
+            self.__append(envelope)
+            return
+        with self.__condition:
+            if len(self.__responses) >= self.__max_items:
+                self.__responses.popleft()
+                self.__dropped.inc()
+            self.__responses.append(envelope)
+            self.__spooled.inc()
+            self.__condition.notify_all()
+
+    def __append(self, envelope):
+        with self.__condition:
+            try:
+                self.__db.execute(
+                    "INSERT INTO events (device_id, service_uri, data) VALUES (?, ?, ?)",
+                    (envelope.device_id, envelope.service_uri, envelope.message.data)
+                )
+                self.__pending += 1
+                self.__spooled.inc()
+                if self.__pending > self.__max_items:
+                    # keep the newest events during long outages
+                    excess = self.__pending - self.__max_items
+                    excess = self.__db.execute("DELETE FROM events WHERE id IN (SELECT id FROM events ORDER BY id LIMIT ?)", (excess,)).rowcount
+                    self.__pending -= excess
+                    self.__dropped.inc(excess)
+                self.__depth.observe(self.__pending)
+                self.__condition.notify_all()
+            except sqlite3.Error as ex:
+                self.__dropped.inc()
+                logger.error("could not spool event for '{}' - {}".format(envelope.device_id, ex))
+
+    def __send(self, kind, envelope, asynchronous: bool):
+        if kind == EVENT:
+            return self.__client.emmitEvent(envelope, asynchronous=asynchronous)
+        return self.__client.sendResponse(envelope, asynchronous=asynchronous)
+
+    def __failed(self, kind, envelope, ex) -> bool:
+        # returns true if the message has to be kept because the connection is gone
+        if isinstance(ex, cc_lib.client.NotConnectedError):
+            self.setConnected(False)
+            return True
+        self.__dropped.inc()
+        logger.error("could not send {} for '{}' - {}".format(kind, envelope.device_id, ex))
+        return False
+
+    def __sendLive(self):
+        with self.__condition:
+            items = list(self.__live)
+            self.__live.clear()
+        if not items:
+            return
+        futures = list()
+        for kind, envelope in items:
+            try:
+                futures.append((kind, envelope, self.__send(kind, envelope, asynchronous=True)))
+            except Exception as ex:
+                if self.__failed(kind, envelope, ex):
+                    self.__spool(kind, envelope)
+        for kind, envelope, future in futures:
+            future.wait()
+            try:
+                future.result()
+            except Exception as ex:
+                if self.__failed(kind, envelope, ex):
+                    self.__spool(kind, envelope)
+
+    def __sendResponses(self) -> bool:
+        # spooled responses go out before the backlog and aren't throttled
+        while True:
+            with self.__condition:
+                if not self.__responses:
+                    return True
+                envelope = self.__responses.popleft()
+            if time.time() - envelope.timestamp > config.Session.max_command_age:
+                # the platform stopped waiting for responses to old commands
+                self.__dropped.inc()
+                continue
+            try:
+                self.__send(RESPONSE, envelope, asynchronous=False)
+                self.__replayed.inc()
+            except Exception as ex:
+                if self.__failed(RESPONSE, envelope, ex):
+                    with self.__condition:
+                        self.__responses.appendleft(envelope)
+                    return False
+
+    def __replay(self):
+        with self.__condition:
+            rows = self.__db.execute("SELECT id, device_id, service_uri, data FROM events ORDER BY id LIMIT ?", (int(self.__replay_rate),)).fetchall()
+        started = time.monotonic()
+        last_id = None
+        for num, (row_id, device_id, service_uri, data) in enumerate(rows):
+            envelope = cc_lib.client.message.EventEnvelope(
+                device=device_id,
+                service=service_uri,
+                message=cc_lib.client.message.Message(data)
+            )
+            try:
+                self.__send(EVENT, envelope, asynchronous=False)
+                self.__replayed.inc()
+            except Exception as ex:
+                if self.__failed(EVENT, envelope, ex):
+                    break
+            # rows are only removed once they were delivered or can't be delivered at all
+            last_id = row_id
+            delay = started + (num + 1) / self.__replay_rate - time.monotonic()
+            while delay > 0:
+                # live messages are sent while the backlog is paced
+                with self.__condition:
+                    if not self.__live:
+                        self.__condition.wait(delay)
+                self.__sendLive()
+                delay = started + (num + 1) / self.__replay_rate - time.monotonic()
+        if last_id is not None:
+            with self.__condition:
+                # rows may already be gone if the spool overflowed meanwhile
+                self.__pending -= self.__db.execute("DELETE FROM events WHERE id <= ?", (last_id,)).rowcount
+                self.__depth.observe(self.__pending)
+                if not self.__pending:
+                    logger.info("spool drained")
+
+    def run(self):
+        while True:
+            with self.__condition:
+                while not (self.__live or (self.__connected and (self.__pending or self.__responses))):
+                    self.__condition.wait()
+            try:
+                self.__sendLive()
+                if self.__isConnected() and self.__sendResponses():
+                    self.__replay()
+            except sqlite3.Error as ex:
+                logger.error("replaying spool failed - {}".format(ex))
+                time.sleep(5)
@@ -14,17 +14,17 @@
    limitations under the License.
 """
 
-__all__ = ('device_type_map', 'DysonPureCoolLink')
+__all__ = ('device_type_map', 'DysonPureCoolLink', 'DysonPureCoolLinkDesk', 'DysonPureHotCoolLink')
 
 
 from ..configuration import config
-from .service import SetPower, SetOscillation, SetSpeed, SetMonitoring, GetSensorReadings, GetDeviceState
+from .service import SetPower, SetOscillation, SetSpeed, SetMonitoring, SetHeatMode, SetHeatTarget, SetFocus, GetSensorReadings, GetSensorHistory, GetDeviceState
 import cc_lib
 
 
 class DysonPureCoolLink(cc_lib.types.Device):
     device_type_id = config.Senergy.dt_pure_cool_link
-    services = (SetPower, SetOscillation, SetSpeed, SetMonitoring, GetSensorReadings, GetDeviceState)
+    services = (SetPower, SetOscillation, SetSpeed, SetMonitoring, GetSensorReadings, GetSensorHistory, GetDeviceState)
     model_num = "475"
 
     def __init__(self, id: str, pw: str, name: str):
@@ -41,15 +41,14 @@ class DysonPureCoolLink(cc_lib.types.Device):
             yield item
 
 
-class DysonPureCoolLinkDesk(cc_lib.types.Device):
-    # device_type_id =
-    # services =
+class DysonPureCoolLinkDesk(DysonPureCoolLink):
+    device_type_id = config.Senergy.dt_pure_cool_link_desk
     model_num = "469"
 
 
-class DysonPureHotCoolLink(cc_lib.types.Device):
-    # device_type_id =
-    # services =
+class DysonPureHotCoolLink(DysonPureCoolLink):
+    device_type_id = config.Senergy.dt_pure_hot_cool_link
+    services = (SetPower, SetOscillation, SetSpeed, SetMonitoring, SetHeatMode, SetHeatTarget, SetFocus, GetSensorReadings, GetSensorHistory, GetDeviceState)
     model_num = "455"
 
 
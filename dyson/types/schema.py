@@ -0,0 +1,97 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ('schemas',)
+
+
+from ..codec import Field, Schema
+
+
+switch_map = {
+    "FAN": True,
+    "AUTO": True,
+    "HEAT": True,
+    "ON": True,
+    "OFF": False,
+}
+
+
+decodeSwitch = switch_map.__getitem__
+
+
+def encodeSwitch(value: bool) -> str:
+    return "ON" if value else "OFF"
+
+
+def decodeSpeed(value) -> int:
+    return 0 if value == "AUTO" else int(value)
+
+
+def encodeSpeed(value: int) -> str:
+    return "{:04d}".format(value)
+
+
+def decodeKelvin(value) -> float:
+    return int(value) / 10
+
+
+def encodeHeatTarget(value: float) -> str:
+    # devices accept 1 - 37 °C
+    if not 274 <= value <= 310:
+        raise ValueError("heat target '{}' out of range".format(value))
+    return "{:04d}".format(int(round(value * 10)))
+
+
+def decodeFilterLife(value) -> float:
+    return round(int(value) / 4300 * 100, 2)
+
+
+state_fields = (
+    Field("fmod", "power", decodeSwitch, lambda value: "FAN" if value else "OFF"),
+    Field("oson", "oscillation", decodeSwitch, encodeSwitch),
+    Field("fnsp", "speed", decodeSpeed, encodeSpeed),
+    Field("rhtm", "monitoring", decodeSwitch, encodeSwitch),
+    Field("filf", "filter_life", decodeFilterLife),
+)
+
+heat_state_fields = state_fields + (
+    Field("hmod", "heat_mode", decodeSwitch, lambda value: "HEAT" if value else "OFF"),
+    Field("hmax", "heat_target", decodeKelvin, encodeHeatTarget),
+    Field("ffoc", "focus", decodeSwitch, encodeSwitch),
+)
+
+sensor_fields = (
+    Field("tact", "tact", decodeKelvin),
+    Field("hact", "hact", int),
+    Field("pact", "pact", int),
+    Field("vact", "vact", int),
+)
+
+read_only = ("filf", "fnst", "ercd", "wacd")
+
+defaults = {"sltm": "STET", "rstf": "STET"}
+
+
+pure_cool_link = Schema(state_fields, sensor_fields, read_only, defaults)
+
+pure_hot_cool_link = Schema(heat_state_fields, sensor_fields, read_only + ("hsta", "tilt"), defaults)
+
+
+schemas = {
+    "475": pure_cool_link,
+    "469": pure_cool_link,
+    "455": pure_hot_cool_link,
+}
@@ -14,28 +14,42 @@
    limitations under the License.
 """
 
-__all__ = ('SetPower', 'SetOscillation', 'SetSpeed', 'SetMonitoring', 'GetSensorReadings', 'GetDeviceState')
+__all__ = ('SetPower', 'SetOscillation', 'SetSpeed', 'SetMonitoring', 'SetHeatMode', 'SetHeatTarget', 'SetFocus', 'GetSensorReadings', 'GetSensorHistory', 'GetDeviceState')
 
 
 from ..logger import root_logger
-import datetime, cc_lib
+from .schema import schemas
+from concurrent.futures import Future
+import datetime, time, cc_lib
 
 
 logger = root_logger.getChild(__name__.split(".", 1)[-1])
 
 
+def applyState(service, device, **values) -> Future:
+    # resolves once the coalesced state is published, the dispatcher does not wait for it
+    result = Future()
+
+    def done(future):
+        err = future.result()
+        if err:
+            logger.error("'{}' for '{}' failed - {}".format(service.__name__, device.id, err))
+        result.set_result({"status": 1 if err else 0})
+
+    try:
+        device.session.setState(schemas[device.model_num].encode(**values)).add_done_callback(done)
+    except (KeyError, ValueError, TypeError) as ex:
+        logger.error("'{}' for '{}' failed - invalid value - {}".format(service.__name__, device.id, ex))
+        result.set_result({"status": 1})
+    return result
+
+
 class SetPower(cc_lib.types.Service):
     local_id = "setPower"
 
     @staticmethod
     def task(device, power: bool):
-        if power:
-            err = device.session.setState({"fmod": "FAN"})
-        else:
-            err = device.session.setState({"fmod": "OFF"})
-        if err:
-            logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, err))
-        return {"status": 1 if err else 0}
+        return applyState(__class__, device, power=power)
 
 
 class SetOscillation(cc_lib.types.Service):
@@ -43,13 +57,7 @@ class SetOscillation(cc_lib.types.Service):
 
     @staticmethod
     def task(device, oscillation: bool):
-        if oscillation:
-            err = device.session.setState({"oson": "ON"})
-        else:
-            err = device.session.setState({"oson": "OFF"})
-        if err:
-            logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, err))
-        return {"status": 1 if err else 0}
+        return applyState(__class__, device, oscillation=oscillation)
 
 
 class SetSpeed(cc_lib.types.Service):
@@ -57,10 +65,7 @@ class SetSpeed(cc_lib.types.Service):
 
     @staticmethod
     def task(device, speed: int):
-        err = device.session.setState({"fnsp": "{:04d}".format(speed)})
-        if err:
-            logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, err))
-        return {"status": 1 if err else 0}
+        return applyState(__class__, device, speed=speed)
 
 
 class SetMonitoring(cc_lib.types.Service):
@@ -68,40 +73,65 @@ class SetMonitoring(cc_lib.types.Service):
 
     @staticmethod
     def task(device, monitoring: bool):
-        if monitoring:
-            err = device.session.setState({"rhtm": "ON"})
-        else:
-            err = device.session.setState({"rhtm": "OFF"})
-        if err:
-            logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, err))
-        return {"status": 1 if err else 0}
+        return applyState(__class__, device, monitoring=monitoring)
+
+
+class SetHeatMode(cc_lib.types.Service):
+    local_id = "setHeatMode"
+
+    @staticmethod
+    def task(device, heat_mode: bool):
+        return applyState(__class__, device, heat_mode=heat_mode)
+
+
+class SetHeatTarget(cc_lib.types.Service):
+    local_id = "setHeatTarget"
+
+    @staticmethod
+    def task(device, heat_target: float):
+        return applyState(__class__, device, heat_target=heat_target)
+
+
+class SetFocus(cc_lib.types.Service):
+    local_id = "setFocus"
+
+    @staticmethod
+    def task(device, focus: bool):
+        return applyState(__class__, device, focus=focus)
 
 
 class GetSensorReadings(cc_lib.types.Service):
     local_id = "getSensorReadings"
 
     @staticmethod
-    def task(readings, timestamp):
-        for key, value in readings.items():
-            if key == "tact":
-                readings[key] = int(value) / 10
-            else:
-                readings[key] = int(value)
+    def task(readings, timestamp, model_num: str = "475"):
+        readings = schemas[model_num].decodeReadings(readings)
         readings["time"] = timestamp
         return readings
 
 
+class GetSensorHistory(cc_lib.types.Service):
+    local_id = "getSensorHistory"
+    read_only = True
+
+    @staticmethod
+    def task(device, duration: int = 3600, resolution: int = 0):
+        history = device.session.getHistory() if device.session else None
+        if history is None:
+            logger.error("'{}' for '{}' failed - no history available".format(__class__.__name__, device.id))
+            return {"status": 1, "readings": []}
+        start = time.time() - duration
+        if resolution > 0:
+            return {"status": 0, "readings": history.downsample(start, resolution)}
+        return {"status": 0, "readings": history.raw(start)}
+
+
 class GetDeviceState(cc_lib.types.Service):
     local_id = "getDeviceState"
-    value_map = {
-        "FAN": True,
-        "AUTO": True,
-        "ON": True,
-        "OFF": False,
-    }
+    read_only = True
 
     @staticmethod
-    def task(device):
+    def payload(state, timestamp: str = None, model_num: str = "475") -> dict:
         payload = {
             "status": 0,
             "power": False,
@@ -109,20 +139,23 @@ class GetDeviceState(cc_lib.types.Service):
             "speed": 1,
             "monitoring": False,
             "filter_life": 0,
-            "time": "{}Z".format(datetime.datetime.utcnow().isoformat())
+            "time": timestamp or "{}Z".format(datetime.datetime.utcnow().isoformat())
         }
-        state = device.session.getState()
         if not state:
-            logger.error("'{}' for '{}' failed - device state not available".format(__class__.__name__, device.id))
             payload["status"] = 1
         else:
             try:
-                payload["power"] = GetDeviceState.value_map[state["fmod"]]
-                payload["oscillation"] = GetDeviceState.value_map[state["oson"]]
-                payload["speed"] = 0 if state["fnsp"] == "AUTO" else int(state["fnsp"])
-                payload["monitoring"] = GetDeviceState.value_map[state["rhtm"]]
-                payload["filter_life"] = round(int(state["filf"]) / 4300 * 100, 2)
-            except KeyError as ex:
-                logger.error("'{}' for '{}' failed - {}".format(__class__.__name__, device.id, ex))
+                payload.update(schemas[model_num].decodeState(state))
+            except (KeyError, ValueError) as ex:
+                logger.error("'{}' failed - {}".format(__class__.__name__, ex))
                 payload["status"] = 1
         return payload
+
+    @staticmethod
+    def task(device):
+        # materialized by the session whenever the device reports a new state
+        payload = device.session.getStatePayload()
+        if payload is None:
+            logger.error("'{}' for '{}' failed - device state not available".format(__class__.__name__, device.id))
+            return GetDeviceState.payload(None, model_num=device.model_num)
+        return payload
@@ -15,11 +15,11 @@
 """
 
 
-__all__ = ('LockingDict', 'unpad', 'decrypt_password')
+__all__ = ('StateSnapshot', 'unpad', 'decrypt_password')
 
 
 from Crypto.Cipher import AES
-import threading, collections.abc, json, base64
+import collections.abc, json, base64
 
 
 def unpad(string):
@@ -54,72 +54,39 @@ def decrypt_password(encrypted_password):
     return json_password["apPasswordHash"]
 
 
-class LockingDict(dict):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.__lock = threading.Lock()
+class StateSnapshot(collections.abc.Mapping):
+    __slots__ = ('__data', '__version')
 
-    def __getitem__(self, item):
-        with self.__lock:
-            return super().__getitem__(item)
-
-    def __setitem__(self, key, value):
-        with self.__lock:
-            super().__setitem__(key, value)
+    def __init__(self, data: dict = None, version: int = 0):
+        self.__data = dict(data or ())
+        self.__version = version
 
-    def __delitem__(self, key):
-        with self.__lock:
-            super().__delitem__(key)
+    @property
+    def version(self) -> int:
+        return self.__version
 
-    def __contains__(self, item):
-        with self.__lock:
-            return super().__contains__(item)
+    def __getitem__(self, item):
+        return self.__data[item]
 
-    def __eq__(self, other):
-        with self.__lock:
-            return super().__eq__(other)
+    def __iter__(self):
+        return iter(self.__data)
 
     def __len__(self):
-        with self.__lock:
-            return super().__len__()
-
-    def items(self) -> collections.abc.ItemsView:
-        with self.__lock:
-            return super().items()
-
-    def keys(self) -> collections.abc.KeysView:
-        with self.__lock:
-            return super().keys()
+        return len(self.__data)
 
-    def values(self) -> collections.abc.ValuesView:
-        with self.__lock:
-            return super().values()
-
-    def copy(self) -> dict:
-        with self.__lock:
-            return super().copy()
-
-    def clear(self):
-        with self.__lock:
-            super().clear()
-
-    def get(self, key):
-        with self.__lock:
-            return super().get(key)
-
-    def pop(self, key):
-        with self.__lock:
-            return super().pop(key)
+    def __contains__(self, item):
+        return item in self.__data
 
-    def popitem(self) -> tuple:
-        with self.__lock:
-            return super().popitem()
+    def get(self, key, default=None):
+        return self.__data.get(key, default)
 
-    def setdefault(self, key, default=...):
-        print(123)
-        with self.__lock:
-            return super().setdefault(key, default)
+    def __repr__(self):
+        return "{}({}, version={})".format(__class__.__name__, self.__data, self.__version)
 
-    def update(self, __m, **kwargs) -> None:
-        with self.__lock:
-            super().update(__m, **kwargs)
+    def update(self, changes: dict) -> "StateSnapshot":
+        # snapshots never change, a new one with a higher version is returned if anything differs
+        if all(key in self.__data and self.__data[key] == value for key, value in changes.items()):
+            return self
+        data = self.__data.copy()
+        data.update(changes)
+        return StateSnapshot(data, self.__version + 1)
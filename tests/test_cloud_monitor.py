@@ -0,0 +1,163 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+# Polls the device manifest from a local https server with a self-signed certificate.
+#
+# Run from the connector's working directory (needs storage/dyson.conf and openssl):
+#   python -m unittest discover tests
+
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dyson.configuration import config
+from dyson.device_manager import DeviceManager
+from dyson.discovery import cloud_monitor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from unittest import mock
+import json, shutil, ssl, subprocess, tempfile, unittest, warnings
+
+
+manifest = json.dumps([{"Serial": "NN2-EU-TEST0001A", "Name": "Test", "ProductType": "000", "LocalCredentials": "pw"}]).encode()
+
+
+class ManifestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    status = 200
+    etag = '"1"'
+    requests = list()
+
+    def do_GET(self):
+        __class__.requests.append(self.headers.get("If-None-Match"))
+        if __class__.status == 200 and __class__.etag and self.headers.get("If-None-Match") == __class__.etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = manifest if __class__.status == 200 else b""
+        self.send_response(__class__.status)
+        if __class__.etag:
+            self.send_header("ETag", __class__.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Client:
+    def __init__(self):
+        self.syncs = 0
+
+    def syncHub(self, devices, asynchronous=False):
+        self.syncs += 1
+
+
+class DeviceCache:
+    def __init__(self):
+        self.updates = 0
+
+    def setDevices(self, devices):
+        self.updates += 1
+
+
+class StopPolling(Exception):
+    pass
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl not available")
+class TestCloudMonitor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cert = os.path.join(cls.tmp_dir.name, "cert.pem")
+        key = os.path.join(cls.tmp_dir.name, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1"],
+            check=True,
+            capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ManifestHandler)
+        cls.server.socket = context.wrap_socket(cls.server.socket, server_side=True)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.config = (config.Cloud.host, config.Cloud.user, config.Cloud.pw, config.Cloud.retry_interval, config.Cloud.max_backoff)
+        config.Cloud.host = "127.0.0.1:{}".format(cls.server.server_address[1])
+        config.Cloud.user = "user"
+        config.Cloud.pw = "pw"
+
+    @classmethod
+    def tearDownClass(cls):
+        config.Cloud.host, config.Cloud.user, config.Cloud.pw, config.Cloud.retry_interval, config.Cloud.max_backoff = cls.config
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        warnings.filterwarnings("ignore", message="Unverified HTTPS request")
+        ManifestHandler.status = 200
+        ManifestHandler.etag = '"1"'
+        ManifestHandler.requests = list()
+
+    def test_modified(self):
+        content, etag = cloud_monitor.apiQueryManifest()
+        self.assertEqual(content, manifest)
+        self.assertEqual(etag, '"1"')
+        self.assertEqual(cloud_monitor.parseManifest(content), dict())
+
+    def test_not_modified(self):
+        content, etag = cloud_monitor.apiQueryManifest('"1"')
+        self.assertIsNone(content)
+        self.assertEqual(etag, '"1"')
+        self.assertEqual(ManifestHandler.requests, ['"1"'])
+
+    def test_unchanged_body(self):
+        # without an etag the digest keeps an identical manifest from being evaluated again
+        ManifestHandler.etag = None
+        client = Client()
+        device_cache = DeviceCache()
+        monitor = cloud_monitor.CloudMonitor(DeviceManager(), client, device_cache)
+        monitor._CloudMonitor__poll()
+        monitor._CloudMonitor__poll()
+        self.assertEqual(len(ManifestHandler.requests), 2)
+        self.assertEqual(device_cache.updates, 1)
+        self.assertEqual(client.syncs, 1)
+
+    def test_backoff(self):
+        ManifestHandler.status = 503
+        config.Cloud.retry_interval = 10
+        config.Cloud.max_backoff = 50
+        delays = list()
+
+        def sleep(delay):
+            delays.append(delay)
+            if len(delays) == 5:
+                raise StopPolling
+
+        monitor = cloud_monitor.CloudMonitor(DeviceManager(), Client())
+        with mock.patch.object(cloud_monitor.time, "sleep", sleep), self.assertRaises(StopPolling):
+            monitor.run()
+        for delay, expected in zip(delays, (10, 20, 40, 50, 50)):
+            self.assertAlmostEqual(delay, expected, delta=expected * 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+   Copyright 2020 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+# Registers a dyson service on a local zeroconf instance and checks the browser events.
+#
+# Run from the connector's working directory (needs storage/dyson.conf):
+#   python -m unittest discover tests
+
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dyson.discovery.mdns import MDNSBrowser, service_type, getDeviceId
+from zeroconf import Zeroconf, ServiceInfo, IPVersion
+import queue, socket, unittest
+
+
+class TestMDNSBrowser(unittest.TestCase):
+    name = "475_NN2-EU-TEST0001A.{}".format(service_type)
+    timeout = 10
+
+    def setUp(self):
+        self.events = queue.Queue()
+        self.zeroconf = Zeroconf(interfaces=["127.0.0.1"], ip_version=IPVersion.V4Only)
+        self.browser = MDNSBrowser(lambda device_id, address: self.events.put((device_id, address)))
+        self.browser.start()
+
+    def tearDown(self):
+        self.browser.stop()
+        self.zeroconf.close()
+
+    def info(self, address, port=1883) -> ServiceInfo:
+        return ServiceInfo(service_type, self.name, port=port, addresses=[socket.inet_aton(address)], server="dyson-test.local.")
+
+    def expect(self, address):
+        while True:
+            device_id, reported = self.events.get(timeout=self.timeout)
+            self.assertEqual(device_id, "NN2-EU-TEST0001A")
+            if reported == address:
+                return
+
+    def test_device_id(self):
+        self.assertEqual(getDeviceId(self.name), "NN2-EU-TEST0001A")
+
+    def test_add_change_remove(self):
+        # dyson service names don't follow rfc 6763 naming rules
+        self.zeroconf.register_service(self.info("127.0.0.1"), strict=False)
+        self.expect(("127.0.0.1", 1883))
+        self.zeroconf.update_service(self.info("127.0.0.2"))
+        self.expect(("127.0.0.2", 1883))
+        self.zeroconf.unregister_service(self.info("127.0.0.2"))
+        self.expect(None)
+
+
+if __name__ == '__main__':
+    unittest.main()